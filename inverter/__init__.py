@@ -33,17 +33,27 @@ defined for the inverter.
 """
 
 import os
+import re
 import sys
+import time
+import fcntl
+import hashlib
+import tempfile
 if not (os.path.abspath('../../thesdk') in sys.path):
     sys.path.append(os.path.abspath('../../thesdk'))
 
-from thesdk import *
-from rtl import *
-from spice import *
+from thesdk import IO, thesdk
 
 import numpy as np
+from inverter.simcache import simcache
+from inverter.core_scheduler import core_scheduler
+from inverter.workspace_pool import workspace_pool
+from inverter.model_runner import model_runner
+from inverter.sweep_result import sweep_result
+from inverter.tracer import tracer
+from inverter.waveform_stream import read_chunks, edge_engine, decimator, integrator
 
-class inverter(rtl,spice,thesdk):
+class inverter(thesdk):
 
     def __init__(self,*arg): 
         """ Inverter parameters and attributes
@@ -74,6 +84,132 @@ class inverter(rtl,spice,thesdk):
 
             model : string
                 Default 'py' for Python. See documentation of thsdk package for more details.
+                Model 'event' is a timed Python model, see event_main.
+
+            tpd : float
+                Propagation delay [s] of the 'event' model. If None, the TPD of 
+                spice/inverter.cir is used. Default None.
+
+            lang : str
+                Language of the rtl testbench, 'sv' or 'vhdl'. Default 'sv'.
+
+            lanes : int
+                Number of parallel lanes of the inverter bus. Data of A and Z is of 
+                shape (samples, lanes). In Verilog simulations the lanes are exchanged 
+                as bus words through the IOs A_BUS and Z_BUS, up to 63 lanes. The VHDL
+                model keeps the scalar std_logic ports, so VHDL and spice models are
+                single lane. Default 1.
+
+            bitpacked : bool
+                If True, the 'py' model assumes the data of 'A' to be bit-packed uint8 words
+                (see numpy.packbits), and 'Z' is returned in the same format. Default False.
+
+            nsamples : int
+                Number of valid samples in bit-packed data. Padding bits of the last word
+                are kept at zero in the output. If None, all bits are valid. Default None.
+
+            inplace : bool
+                If True, the 'py' model writes the result into the array
+                preallocated to self.IOS.Members['Z'].Data. Default False.
+
+            cache : bool
+                If True, results of rtl and spice simulations are cached on disk
+                and simulations with identical inputs, parameters and sources are
+                not rerun. Default False.
+
+            cachedir : str
+                Directory of the simulation cache. Default: simcache directory of the entity.
+
+            cachesize : int
+                Maximum size of the simulation cache in bytes. Default 1 GiB.
+
+            rtl_binary_io : bool
+                If True, Verilog testbenches write the output Z as a raw binary file 
+                that is memory-mapped to self.IOS.Members['Z'].Data without parsing
+                or copying. Default False.
+
+            rtl_reuse_build : bool
+                If True, the compiled RTL simulation is kept and reused in subsequent 
+                runs until the RTL sources or rtlparameters change. Only the IO files 
+                are rewritten. Concurrent runs of the same build are serialized with a 
+                lock in the build directory. Default False.
+
+            rtl_phase_timing : bool
+                If True, the span 'run_rtl' of self.tracer is divided to the phases of
+                the rtl simulation, see run_rtl_timed. Default False.
+
+            spice_streaming : bool
+                If True, the outputs Z, Z_RISE and A_DIG of spice simulations are extracted 
+                from the event waveforms in a single pass after the simulation, instead of 
+                separate parsing of every output. The event waveforms, including CLK_OUT,
+                are read whole by spice_iofile, so the peak memory is not reduced. 
+                Default False.
+
+            streamchunk : int
+                Number of waveform rows processed at a time in streaming extraction. Default 2**16.
+
+            keep_waveforms : bool
+                If False, the dense waveforms Z_ANA, A_OUT and CLK_OUT are dropped after 
+                streaming extraction. Default False.
+
+            waveform_decimation : int
+                Decimation factor of the dense waveforms kept in streaming extraction. Default 1.
+
+            reuse_workspace : bool
+                If True, rtl and spice simulations run in a directory reused by all
+                runs of the process, on tmpfs if available, instead of a new directory
+                per run. The simulation and IO files are overwritten rather than
+                deleted. Ignored for rtl models if rtl_reuse_build is True. See 
+                inverter.workspace_pool. Default False.
+
+            workspaces : workspace_pool
+                Pool of the reused simulation directories.
+
+            power_metrics : bool
+                If True, the average power, energy, energy per output transition and
+                peak current of the supply are integrated from the supply current of 
+                spice simulations in chunks of self.streamchunk rows. The metrics are 
+                set to self.IOS.Members['POWER'] as a structured array of one row, and
+                the current waveform is dropped unless self.keep_waveforms is True. 
+                Default False.
+
+            spice_nproc : int
+                Number of threads of spice simulations, reserved from the core scheduler
+                regardless of the fair share. If None, the number is
+                chosen from the transient length, and limited to the fair share
+                of the cores among concurrently running simulations, see 
+                inverter.core_scheduler. Default None.
+
+            spice_maxnproc : int
+                Maximum number of threads chosen for a spice simulation. Default 8.
+
+            spice_samples_per_thread : int
+                Samples of A per thread of a spice simulation. Default 4096.
+
+            corescheduler : core_scheduler
+                Scheduler of the cores shared by the simulations of all processes.
+
+            incremental : bool
+                If True, rtl and py models resimulate only the windows of A that differ from 
+                the previous run, and splice the results into the previous Z. Event and
+                spice models, whose timed outputs can not be spliced, are always simulated
+                in full. Default False.
+
+            guard : int
+                Number of samples simulated before and after every changed window of A in
+                incremental mode. Must cover the latency and the reset of the model. Default 8.
+
+            incremental_limit : float
+                Fraction of the samples above which incremental mode falls back to a full 
+                simulation. Default 0.5.
+
+            tracer : tracer
+                Timing and data volume instrumentation of the phases of run. 
+                See inverter.tracer. Export with self.tracer.dump(file, format='chrome').
+
+            spicecorner : dict
+                Corner and temperature of spice simulations. 
+                Default {'corner': 'top_tt', 'temp': 27}
 
         """
         self.print_log(type='I', msg='Initializing %s' %(__name__)) 
@@ -91,9 +227,67 @@ class inverter(rtl,spice,thesdk):
         ## Extracting values of A and Z at falling edges of CLK in decimal format (integer, in this case 0 or 1)
         ## The clock signal can be any node voltage in the simulation
         self.IOS.Members['A_DIG'] = IO()
+        ## Clock waveform for streaming extraction of sampled outputs
+        self.IOS.Members['CLK_OUT'] = IO()
+        ## Bus words of multi-lane rtl simulations
+        self.IOS.Members['A_BUS'] = IO()
+        self.IOS.Members['Z_BUS'] = IO()
+        ## Power metrics of spice simulations
+        self.IOS.Members['POWER'] = IO()
 
         self.IOS.Members['control_write'] = IO() # File for control is created in controller
         self.model = 'py' # Can be set externally, but is not propagated
+        self.lang = 'sv' # Testbench language of rtl simulations
+        self.tpd = None # Propagation delay of the event model
+        self.lanes = 1 # Width of the inverter bus
+        self.bitpacked = False # Data of A and Z are bit-packed uint8 words
+        self.nsamples = None # Number of valid samples in bit-packed data
+        self.inplace = False # Write output to preallocated Z buffer
+        self.cache = False # Cache simulation results
+        self.cachedir = None # Defaults to simcache directory of the entity
+        self.cachesize = 2**30
+        self.rtl_binary_io = False # Raw binary output file for Verilog simulations
+        self.rtl_reuse_build = False # Compile once, run many
+        self._rtl_session_built = False
+        self._rtl_session = {} # Lock and the settings restored by release_rtl_session
+        self.rtl_phase_timing = False # Time stamps between the steps of rtl simulations
+        self.spice_streaming = False # Chunked extraction of spice outputs
+        self.streamchunk = 2**16
+        self.keep_waveforms = False
+        self.waveform_decimation = 1
+        self.reuse_workspace = False # Reuse simulation directories between runs
+        self._workspace_restore = {}
+        self.workspaces = workspace_pool(self)
+        self.power_metrics = False # Integrate supply power of spice simulations
+        self.spice_nproc = None # Chosen by the core scheduler
+        self.spice_maxnproc = 8
+        self.spice_samples_per_thread = 2**12
+        self.corescheduler = core_scheduler(self)
+        self._spice_deck = None # Signature of the static part of the spice testbench
+        self._spice_misc = []
+        self.incremental = False # Resimulate changed windows only
+        self.guard = 8
+        self.incremental_limit = 0.5
+        self._incremental_state = None
+        self.tracer = tracer() # Phase timing instrumentation
+
+        # Spice simulation options and parameters
+        self.spiceoptions = {
+                    'eps': '1e-6'
+                }
+        self.spiceparameters = {
+                    'exampleparam': '0'
+                }
+
+        # Defining library options
+        # Path to model libraries needs to be defined in TheSDK.config as
+        # either ELDOLIBFILE or SPECTRELIBFILE. In this case, no model libraries
+        # will be included (assuming these variables are not defined). The
+        # temperature will be set regardless.
+        self.spicecorner = {
+                    'corner': 'top_tt',
+                    'temp': 27,
+                }
 
         # this copies the parameter values from the parent based on self.proplist
         if len(arg)>=1:
@@ -121,12 +315,167 @@ class inverter(rtl,spice,thesdk):
 
         '''
         inval=self.IOS.Members['A'].Data
-        out=np.array(1-inval)
+        if self.inplace:
+            out=self.IOS.Members['Z'].Data
+        else:
+            out=None
+        out=self.invert(inval,out=out,nsamples=self.nsamples)
         self.IOS.Members['Z'].Data=out
         if self.par:
             ret_dict=self.IOS.Members #Adds IOS to return dictionary
             self.queue.put(ret_dict)
 
+    def invert(self,inval,**kwargs):
+        ''' Inverts a block of samples. The dtype of the input is preserved, 
+        and no intermediate copies are made.
+
+        Parameters
+        ----------
+        inval : ndarray
+            Input samples, or bit-packed uint8 words if self.bitpacked is True.
+        out : ndarray
+            Optional preallocated output array of the same shape. Default None.
+        nsamples : int
+            Number of valid samples in bit-packed input. Default None.
+
+        '''
+        out=kwargs.get('out',None)
+        nsamples=kwargs.get('nsamples',None)
+        inval=np.asarray(inval)
+        if self.bitpacked:
+            if inval.dtype != np.uint8:
+                self.print_log(type='F', msg='Bit-packed data must be of type uint8, got %s' %(inval.dtype))
+            out=np.bitwise_not(inval,out=out)
+            if nsamples is not None:
+                self.clear_padding(out,nsamples)
+        elif inval.dtype == bool:
+            out=np.logical_not(inval,out=out)
+        else:
+            out=np.subtract(1,inval,out=out,dtype=inval.dtype)
+        return out
+
+    def clear_padding(self,out,nsamples):
+        ''' Sets the padding bits of bit-packed words after nsamples valid samples to zero.
+
+        '''
+        if nsamples > 8*out.size:
+            self.print_log(type='F', msg='%s samples do not fit in %s packed words' %(nsamples,out.size))
+        nwords=-(-nsamples//8)
+        if nsamples%8:
+            out.flat[nwords-1]=out.flat[nwords-1] & np.uint8((0xFF<<(8-nsamples%8))&0xFF)
+        out.flat[nwords:]=0
+        return out
+
+    def event_main(self):
+        ''' Timed Python model of the inverter, the 'event' model.
+
+        The samples of A are applied at the rising edges of the clock of rate
+        self.Rs, starting at the first edge after initdone is set by the 
+        controller, as in the rtl testbenches. Before that, A is 0. The output 
+        follows the input with the propagation delay self.tpd, and is sampled 
+        at the falling edges of the clock. 
+
+        Z_RISE and Z_ANA are the rising edge times and the waveform 
+        (rows of time, voltage) of the output of the first lane, computed 
+        from the edge list of the input.
+
+        '''
+        if self.bitpacked:
+            self.print_log(type='F', msg='Bit-packed data not supported by the event model')
+        inval=np.asarray(self.IOS.Members['A'].Data)
+        inval=inval.reshape(len(inval),-1)
+        tpd=self.tpd if self.tpd is not None else self.netlist_tpd()
+        period=1/self.Rs
+        tstart=np.ceil(self.initdone_time()/period)*period
+        # Samples of A settled at the falling edges, the offset is in whole periods
+        offset=int(np.floor(0.5-tpd/period))
+        if -offset >= len(inval):
+            outval=np.ones_like(inval)
+        else:
+            outval=np.empty_like(inval)
+            outval[max(0,-offset):]=np.subtract(1,inval[max(0,offset):len(inval)+min(0,offset)],dtype=inval.dtype)
+            outval[:max(0,-offset)]=1
+        self.IOS.Members['Z'].Data=outval
+
+        # Edge list of the first lane, A is 0 before the first sample
+        a=inval[:,0]
+        edges=np.flatnonzero(np.diff(a,prepend=0) != 0)
+        times=tstart+edges*period+tpd
+        zlevel=(1-a[edges])*self.vdd
+        self.IOS.Members['Z_RISE'].Data=times[zlevel > 0].reshape(-1,1)
+        # Ideal steps, two points per edge
+        tend=tstart+len(a)*period+tpd
+        zana=np.empty((2*len(edges)+2,2))
+        zana[0]=[0,self.vdd]
+        zana[1:-1:2,0]=times
+        zana[1:-1:2,1]=np.r_[self.vdd,zlevel[:-1]]
+        zana[2:-1:2,0]=times
+        zana[2:-1:2,1]=zlevel
+        zana[-1]=[tend,zana[-2,1]]
+        self.IOS.Members['Z_ANA'].Data=zana
+        if self.par:
+            self.queue.put(self.IOS.Members)
+
+    def netlist_tpd(self):
+        ''' Propagation delay [s] defined by TPD in spice/inverter.cir. Default 0.2 ns.
+
+        '''
+        units={ 'f' : 1e-15, 'p' : 1e-12, 'n' : 1e-9, 'u' : 1e-6, 'm' : 1e-3 }
+        netlist=os.path.join(self.entitypath,'spice','inverter.cir')
+        if os.path.isfile(netlist):
+            with open(netlist) as f:
+                for line in f:
+                    if line.lstrip().startswith('*'):
+                        continue
+                    match=re.search(r'\bTPD\s*=\s*([0-9.]+(?:[eE][-+]?[0-9]+)?)([a-zA-Z]?)',line)
+                    if match:
+                        return float(match.group(1))*units.get(match.group(2).lower(),1)
+        return 0.2e-9
+
+    def initdone_time(self):
+        ''' Time [s] at which the controller sets initdone. 0 if there is no controller.
+
+        '''
+        control=self.IOS.Members['control_write'].Data
+        if control is None or not hasattr(control,'rtl_connectors'):
+            return 0.0
+        names=[ connector.name for connector in control.rtl_connectors ]
+        data=np.asarray(control.Data)
+        if 'initdone' not in names or data.size == 0:
+            return 0.0
+        data=data.reshape(-1,len(names)+1)
+        done=np.flatnonzero(data[:,names.index('initdone')+1] == 1)
+        # Control times are in ps
+        return data[done[0],0]*1e-12 if len(done) else 0.0
+
+    def stream(self,chunks):
+        ''' Generator for streaming operation of the 'py' model. Processes the
+        input chunk by chunk, so that the peak memory is defined by the 
+        chunk size rather than by the total length of the data.
+
+        Parameters
+        ----------
+        chunks : iterable
+            Iterable of input chunks of A, e.g. data of signal_source.stream().
+            In bit-packed mode the chunks are packed words and self.nsamples is
+            the total number of samples of the stream.
+
+        Yields
+        ------
+        (A, Z) : tuple of ndarrays
+            Input chunk and the corresponding output chunk.
+
+        '''
+        if self.model != 'py':
+            self.print_log(type='F', msg='Streaming not supported for model %s' %(self.model))
+        consumed=0
+        for inval in chunks:
+            nsamples=None
+            if self.bitpacked and self.nsamples is not None:
+                nsamples=max(0,min(8*np.size(inval),self.nsamples-consumed))
+                consumed+=8*np.size(inval)
+            yield inval, self.invert(inval,nsamples=nsamples)
+
     def run(self,*arg):
         ''' The default name of the method to be executed. This means: parameters and attributes 
             control what is executed if run method is executed. By this we aim to avoid the need of 
@@ -139,150 +488,924 @@ class inverter(rtl,spice,thesdk):
                 and it is assigned to self.queue and self.par is set to True. 
         
         '''
-        if self.model=='py':
-            self.main()
-        else: 
-            # This defines contents of modelsim control file executed when interactive_rtl = True
-            # Interactive control files
-            if self.model in [ 'icarus', 'verilator', 'ghdl']:
-                self.interactive_control_contents="""
-                    set io_facs [list] 
-                    lappend io_facs "tb_inverter.A"
-                    lappend io_facs "tb_inverter.Z" 
-                    lappend io_facs "tb_inverter.clock"
-                    gtkwave::addSignalsFromList $io_facs 
-                    gtkwave::/Time/Zoom/Zoom_Full
-                """
+        if len(arg)>0:
+            self.par=True      # Flag for parallel processing
+            self.queue=arg[0]  # multiprocessing.Queue as the first argument
+        if self.incremental and self.model not in ['event','eldo','spectre','ngspice']:
+            self.run_incremental()
+            return
+        with self.tracer.span('run',model=self.model):
+            self.count_bytes('input_bytes',['A'])
+            if self.model=='py':
+                with self.tracer.span('main'):
+                    self.main()
+                self.count_bytes('output_bytes',['Z'])
+            elif self.model=='event':
+                with self.tracer.span('main'):
+                    self.event_main()
+                self.count_bytes('output_bytes',['Z', 'Z_RISE', 'Z_ANA'])
+            else: 
+                with self.tracer.span('setup'):
+                    # Simulator backends are loaded on first use
+                    self.load_backend()
+                    # Settings of a failed earlier run are restored
+                    self.release_workspace()
+                    self.release_rtl_session()
+                    rtlmodel=self.model in ['sv', 'icarus', 'verilator', 'vhdl', 'ghdl']
+                    if self.reuse_workspace and not (rtlmodel and self.rtl_reuse_build):
+                        self.use_workspace()
+                    if self.model in ['sv', 'icarus', 'verilator', 'vhdl', 'ghdl']:
+                        from rtl import rtl_iofile
+                    elif self.model in ['eldo','spectre','ngspice']:
+                        from spice import spice_iofile
+                    if self.model in ['sv', 'icarus', 'verilator', 'vhdl', 'ghdl']:
+                        self.rtlparameters=dict([ ('g_Rs',('real',self.Rs)), # Defines the sample rate
+                            ('g_lanes',('integer',self.lanes)),]) # Defines the bus width
+                        if not 1 <= self.lanes <= 63:
+                            self.print_log(type='F', msg='Number of lanes must be within 1...63 for rtl models')
+                        if self.model in ['vhdl', 'ghdl'] and self.lanes != 1:
+                            self.print_log(type='F', msg='VHDL models support a single lane only')
+                        # IO files are redefined below
+                        for name in ['A', 'Z', 'A_BUS', 'Z_BUS']:
+                            self.iofile_bundle.Members.pop(name,None)
+                        if self.lanes > 1:
+                            self.IOS.Members['A_BUS'].Data=self.pack_lanes(self.IOS.Members['A'].Data)
+                        # Session must be opened before the simulation path is used
+                        if self.rtl_reuse_build:
+                            self.open_rtl_session()
+
+                    # This defines contents of modelsim control file executed when interactive_rtl = True
+                    # Interactive control files
+                    if self.model in [ 'icarus', 'verilator', 'ghdl']:
+                        self.interactive_control_contents="""
+                            set io_facs [list] 
+                            lappend io_facs "tb_inverter.A"
+                            lappend io_facs "tb_inverter.Z" 
+                            lappend io_facs "tb_inverter.clock"
+                            gtkwave::addSignalsFromList $io_facs 
+                            gtkwave::/Time/Zoom/Zoom_Full
+                        """
+                    else:
+                        self.interactive_control_contents="""
+                            add wave \\
+                            sim/:tb_inverter:A \\
+                            sim/:tb_inverter:initdone \\
+                            sim/:tb_inverter:clock \\
+                            sim/:tb_inverter:Z
+                            run -all
+                            wave zoom full
+                        """
+
+                    if self.model == 'ghdl':
+                        # With this structure you can control the signals to be dumped to VCD 
+                        #pass
+                        self.simulator_control_contents=("version = 1.1  # Optional\n"
+                        + "/tb_inverter/A\n"
+                        + "/tb_inverter/Z\n"
+                        + "/tb_inverter/clock\n"
+                        )
+
+                    if self.model == 'sv': 
+                        self.simulator_control_contents = ("vcd file %s/inverter_dump.vcd\n" %(self.rtlsimpath)
+                        + "vcd add -r *\n"
+                        + "vcd on\n"
+                        + "run -all\n"
+                        + "quit\n"
+                        )
+
+                    if self.model in ['sv', 'icarus', 'verilator' ]:
+                        # Verilog simulation options here
+                        _=rtl_iofile(self, name=self.rtl_ionames[0], dir='in', iotype='sample', ionames=['A'], datatype='sint') # IO file for input A
+                        if self.rtl_binary_io and self.lang == 'sv':
+                            # Output Z is written by the testbench as raw binary
+                            if self.lanes > 32:
+                                self.print_log(type='F', msg='Binary IO supports at most 32 lanes')
+                            self.define_binary_output()
+                        else:
+                            self.remove_binary_output()
+                            f=rtl_iofile(self, name=self.rtl_ionames[1], dir='out', iotype='sample', ionames=['Z'], datatype='sint')
+                            # This is to avoid sampling time confusion with Icarus
+                            if self.lang == 'sv':
+                                f.rtl_io_sync='@(negedge clock)'
+                            elif self.lang == 'vhdl':
+                                f.rtl_io_sync='falling_edge(clock)'
+
+                    elif self.model=='vhdl' or self.model == 'ghdl':
+                        # VHDL simulation options here
+                        _=rtl_iofile(self, name=self.rtl_ionames[0], dir='in', iotype='sample', ionames=['A']) # IO file for input A
+                        f=rtl_iofile(self, name=self.rtl_ionames[1], dir='out', iotype='sample', ionames=['Z'], datatype='int')
+                        if self.lang == 'sv':
+                            f.rtl_io_sync='@(negedge clock)'
+                        elif self.lang == 'vhdl':
+                            f.rtl_io_sync='falling_edge(clock)'
+                    elif self.model in ['eldo','spectre','ngspice']:
+                        if self.lanes != 1:
+                            self.print_log(type='F', msg='Spice models support a single lane only')
+
+                        # Creating a clock signal, which is used for testing the sample output features
+                        _=spice_iofile(self, name='CLK', dir='in', iotype='sample', ionames='CLK', rs=2*self.Rs, \
+                                       vhi=self.vdd, trise=1/(self.Rs*8), tfall=1/(self.Rs*8))
+                        # Sample type input
+                        _=spice_iofile(self, name='A', dir='in', iotype='sample', ionames='A', rs=self.Rs, \
+                                       vhi=self.vdd, trise=1/(self.Rs*4), tfall=1/(self.Rs*4))
+
+                        # These are helper IOS for analog simulation
+                        _=spice_iofile(self, name='Z_ANA', dir='out', iotype='event', sourcetype='V', ionames='Z')
+
+                        # Saving the analog waveform of the input as well
+                        _=spice_iofile(self, name='A_OUT', dir='out', iotype='event', sourcetype='V', ionames='A')
+
+                        if self.spice_streaming:
+                            # Sampled and timed outputs are extracted from the event waveforms in chunks 
+                            # after the simulation. See extract_streaming.
+                            for name in ['Z', 'Z_RISE', 'A_DIG']:
+                                self.iofile_bundle.Members.pop(name,None)
+                            _=spice_iofile(self, name='CLK_OUT', dir='out', iotype='event', sourcetype='V', ionames='CLK')
+                        else:
+                            self.iofile_bundle.Members.pop('CLK_OUT',None)
+                            # Sample type output
+                            # Clock is used to sample the waveform in analog simulation
+                            _=spice_iofile(self, name='Z', dir='out', iotype='sample', ionames='Z', trigger='CLK', \
+                                           vth=self.vdd/2,edgetype='rising',ioformat='dec')
+
+                            # For Extracting rising edges from the output waveform
+                            _=spice_iofile(self, name='Z_RISE', dir='out', iotype='time', sourcetype='V', ionames='Z', \
+                                           edgetype='rising',vth=self.vdd/2)
+
+                            ## Extracting values of A and Z at falling edges of CLK in decimal format (integer, in this case 0 or 1)
+                            ## The clock signal can be any node voltage in the simulation
+                            _=spice_iofile(self, name='A_DIG', dir='out', iotype='sample', ionames='A', trigger='CLK', \
+                                           vth=self.vdd/2,edgetype='rising',ioformat='dec')
+
+                        # Multithreading, options and parameters
+                        # Options, parameters and corner are defined in __init__
+                        # Number of threads is granted by the core scheduler in simulate
+
+                        # Supplies, manual commands and the simulation command are reused
+                        # while the model and the supply voltage are unchanged
+                        self.define_spice_deck()
+
+                with self.tracer.span('cache_load'):
+                    cached=self.cache and self.load_cached()
+                if not cached:
+                    self.simulate()
+                    if self.cache:
+                        with self.tracer.span('cache_store'):
+                            self.store_cached()
+                self.count_bytes('output_bytes',self.outputs)
+
+                self.release_workspace()
+
+                if self.par:
+                    self.queue.put(self.IOS.Members)
+
+    def run_incremental(self):
+        ''' Runs the model for the windows of A changed since the previous run,
+        and splices the results into the previous Z. 
+
+        The windows, each extended by self.guard samples on both sides, are
+        simulated back to back in a single run. For a design with a response
+        bounded to the guard, the guard samples settle the state of every 
+        window. A full run is made if there is no previous run with the same
+        parameters and data shape.
+
+        '''
+        inval=self.IOS.Members['A'].Data
+        windows=self.dirty_windows(inval)
+        par=self.par
+        nsamples=self.nsamples
+        members=dict([ (name, self.IOS.Members[name]) for name in ['A', 'Z'] ])
+        self.par=False
+        self.incremental=False
+        try:
+            if windows is None:
+                self.run()
+                outval=self.IOS.Members['Z'].Data
             else:
-                self.interactive_control_contents="""
-                    add wave \\
-                    sim/:tb_inverter:A \\
-                    sim/:tb_inverter:initdone \\
-                    sim/:tb_inverter:clock \\
-                    sim/:tb_inverter:Z
-                    run -all
-                    wave zoom full
-                """
-
-            if self.model == 'ghdl':
-                # With this structure you can control the signals to be dumped to VCD 
-                #pass
-                self.simulator_control_contents=("version = 1.1  # Optional\n"
-                + "/tb_inverter/A\n"
-                + "/tb_inverter/Z\n"
-                + "/tb_inverter/clock\n"
-                )
-
-            if self.model == 'sv': 
-                self.simulator_control_contents = ("vcd file %s/inverter_dump.vcd\n" %(self.rtlsimpath)
-                + "vcd add -r *\n"
-                + "vcd on\n"
-                + "run -all\n"
-                + "quit\n"
-                )
-
-            if self.model in ['sv', 'icarus', 'verilator' ]:
-                # Verilog simulation options here
-                _=rtl_iofile(self, name='A', dir='in', iotype='sample', ionames=['A'], datatype='sint') # IO file for input A
-                f=rtl_iofile(self, name='Z', dir='out', iotype='sample', ionames=['Z'], datatype='sint')
-                # This is to avoid sampling time confusion with Icarus
-                if self.lang == 'sv':
-                    f.rtl_io_sync='@(negedge clock)'
-                elif self.lang == 'vhdl':
-                    f.rtl_io_sync='falling_edge(clock)'
-
-                self.rtlparameters=dict([ ('g_Rs',('real',self.Rs)),]) # Defines the sample rate
-                self.run_rtl()
-                self.IOS.Members['Z'].Data=self.IOS.Members['Z'].Data[:,0].astype(int).reshape(-1,1)
-            elif self.model=='vhdl' or self.model == 'ghdl':
-                # VHDL simulation options here
-                _=rtl_iofile(self, name='A', dir='in', iotype='sample', ionames=['A']) # IO file for input A
-                f=rtl_iofile(self, name='Z', dir='out', iotype='sample', ionames=['Z'], datatype='int')
-                if self.lang == 'sv':
-                    f.rtl_io_sync='@(negedge clock)'
-                elif self.lang == 'vhdl':
-                    f.rtl_io_sync='falling_edge(clock)'
-                self.rtlparameters=dict([ ('g_Rs',('real',self.Rs)),]) # Defines the sample rate
-                self.run_rtl()
-                self.IOS.Members['Z'].Data=self.IOS.Members['Z'].Data.astype(int).reshape(-1,1)
-            elif self.model in ['eldo','spectre','ngspice']:
-
-                # Creating a clock signal, which is used for testing the sample output features
-                _=spice_iofile(self, name='CLK', dir='in', iotype='sample', ionames='CLK', rs=2*self.Rs, \
-                               vhi=self.vdd, trise=1/(self.Rs*8), tfall=1/(self.Rs*8))
-                # Sample type input
-                _=spice_iofile(self, name='A', dir='in', iotype='sample', ionames='A', rs=self.Rs, \
-                               vhi=self.vdd, trise=1/(self.Rs*4), tfall=1/(self.Rs*4))
-
-                # These are helper IOS for analog simulation
-                _=spice_iofile(self, name='Z_ANA', dir='out', iotype='event', sourcetype='V', ionames='Z')
-                
-                # Sample type output
-                # Clock is used to sample the waveform in analog simulation
-                _=spice_iofile(self, name='Z', dir='out', iotype='sample', ionames='Z', trigger='CLK', \
-                               vth=self.vdd/2,edgetype='rising',ioformat='dec')
-                
-
-                # Saving the analog waveform of the input as well
-                _=spice_iofile(self, name='A_OUT', dir='out', iotype='event', sourcetype='V', ionames='A')
-
-                # For Extracting rising edges from the output waveform
-                _=spice_iofile(self, name='Z_RISE', dir='out', iotype='time', sourcetype='V', ionames='Z', \
-                               edgetype='rising',vth=self.vdd/2)
-
-
-                ## Extracting values of A and Z at falling edges of CLK in decimal format (integer, in this case 0 or 1)
-                ## The clock signal can be any node voltage in the simulation
-                _=spice_iofile(self, name='A_DIG', dir='out', iotype='sample', ionames='A', trigger='CLK', \
-                               vth=self.vdd/2,edgetype='rising',ioformat='dec')
-
-                # Multithreading, options and parameters
-                self.nproc = 2
-                self.spiceoptions = {
-                            'eps': '1e-6'
-                        }
-                self.spiceparameters = {
-                            'exampleparam': '0'
-                        }
-
-                # Defining library options
-                # Path to model libraries needs to be defined in TheSDK.config as
-                # either ELDOLIBFILE or SPECTRELIBFILE. In this case, no model libraries
-                # will be included (assuming these variables are not defined). The
-                # temperature will be set regardless.
-                self.spicecorner = {
-                            'corner': 'top_tt',
-                            'temp': 27,
-                        }
-
-                # Example of defining supplies (not used here because the example inverter has no supplies)
-                _=spice_dcsource(self,name='supply',value=self.vdd,pos='VDD',neg='VSS',extract=True)
-                _=spice_dcsource(self,name='ground',value=0,pos='VSS',neg='0')
-
-                # Adding a resistor between VDD and VSS to demonstrate power consumption extraction
-                # This also demonstrates how to inject manual commands in to the testbench
-                if self.model=='spectre':
-                    self.spicemisc.append('simulator lang=spice')
-                self.spicemisc.append('Rtest VDD VSS 2000')
-                if self.model=='spectre':
-                    self.spicemisc.append('simulator lang=spectre')
-                
-                # Plotting nodes for interactive waveform viewing.
-                # Spectre also supported, but without 'v()' specifiers.
-                # i.e. plotlist = ['A','Z']
-                if self.model == 'eldo':
-                    plotlist = ['v(A)','v(Z)']
-                elif self.model == 'spectre':
-                    plotlist = ['A','Z']
+                self.print_log(type='I', msg='Resimulating %d windows of %d samples' 
+                        %(len(windows),(windows[:,2]-windows[:,1]).sum()))
+                outval=np.array(self._incremental_state['Z'],copy=True)
+                if len(windows):
+                    self.IOS.Members['A']=IO()
+                    self.IOS.Members['Z']=IO()
+                    self.IOS.Members['A'].Data=np.concatenate([ inval[w0:w1] for _, w0, w1 in windows ])
+                    # Count of valid bit-packed samples applies to the full vector, 
+                    # the padding is cleared after splicing
+                    self.nsamples=None
+                    self.run()
+                    self.nsamples=nsamples
+                    segments=self.IOS.Members['Z'].Data
+                    self.IOS.Members.update(members)
+                    offsets=np.r_[0,np.cumsum(windows[:,2]-windows[:,1])]
+                    if segments is None or len(segments) != offsets[-1]:
+                        self.print_log(type='W', msg='Output length differs from input, simulating in full')
+                        self.run()
+                        outval=self.IOS.Members['Z'].Data
+                    else:
+                        for (start, w0, w1), offset in zip(windows,offsets):
+                            # Output before start is not affected by the changes
+                            outval[start:w1]=segments[offset+start-w0:offset+w1-w0]
+                        if self.bitpacked and nsamples is not None:
+                            self.clear_padding(outval,nsamples)
+                self.IOS.Members['Z'].Data=outval
+        finally:
+            self.IOS.Members.update(members)
+            self.par=par
+            self.nsamples=nsamples
+            self.incremental=True
+        self._incremental_state={ 
+                'key' : self.incremental_key(), 
+                'A' : np.array(inval,copy=True), 
+                'Z' : np.array(outval,copy=True) 
+                }
+        if self.par:
+            self.queue.put(self.IOS.Members)
+
+    def incremental_key(self):
+        ''' Parameters whose change invalidates the previous run in incremental mode.
+
+        '''
+        return repr((self.model, self.lang, self.Rs, self.vdd, self.tpd, self.lanes, self.bitpacked, 
+            self.nsamples))
+
+    def dirty_windows(self,inval):
+        ''' Finds the windows of inval that differ from the input of the previous run.
+
+        Returns
+        -------
+        ndarray or None
+            Rows of (first changed sample, window start, window end), 
+            windows including the guard. None if a full run is needed.
+
+        '''
+        state=self._incremental_state
+        inval=np.asarray(inval)
+        if (state is None or state['key'] != self.incremental_key() 
+                or state['A'].shape != inval.shape or state['Z'] is None
+                or len(state['Z']) != len(inval)):
+            return None
+        diff=inval != state['A']
+        if diff.ndim > 1:
+            diff=diff.reshape(len(diff),-1).any(axis=1)
+        dirty=np.flatnonzero(diff)
+        if len(dirty)==0:
+            return np.zeros((0,3),dtype=np.int64)
+        # Changes closer than two guards are simulated in a single window
+        breaks=np.flatnonzero(np.diff(dirty) > 2*self.guard)
+        starts=dirty[np.r_[0,breaks+1]]
+        ends=dirty[np.r_[breaks,len(dirty)-1]]+1
+        windows=np.stack((starts,np.maximum(starts-self.guard,0),
+            np.minimum(ends+self.guard,len(inval))),axis=1)
+        if (windows[:,2]-windows[:,1]).sum() > self.incremental_limit*len(inval):
+            return None
+        return windows
+
+    def load_backend(self):
+        ''' Turns this instance to an instance of the inverter with the rtl and
+        spice simulator backends. The backends are imported only when an 
+        rtl or spice model is run, to keep 'py' model runs free of them.
+
+        Attributes set before loading that are properties of the backends 
+        are re-assigned through the properties.
+
+        '''
+        backend=_backend_class()
+        if isinstance(self,backend):
+            return
+        shadowed=dict([ (name, value) for name, value in self.__dict__.items() 
+                if isinstance(getattr(backend,name,None),property) ])
+        for name in shadowed:
+            del self.__dict__[name]
+        self.__class__=backend
+        for name, value in shadowed.items():
+            setattr(self,name,value)
+
+    def count_bytes(self,name,members):
+        ''' Adds the size of the data of the given IOS members to the counter name
+        of self.tracer.
+
+        '''
+        for member in members:
+            data=self.IOS.Members[member].Data
+            if isinstance(data,np.ndarray):
+                self.tracer.count(name,data.nbytes)
+
+    def sweep(self,nworkers=None,**grid):
+        ''' Simulates the entity over a grid of parameters. 
+
+        Every point of the grid is simulated with a copy of this entity, the
+        copies are run concurrently with model_runner. Points differing only 
+        in parameters the model does not depend on, e.g. vdd and temp of rtl 
+        models, are simulated once, see sweep_signature. Every distinct point 
+        of spice models is a separate simulator launch. Results are cached
+        if self.cache is True.
+
+        Parameters
+        ----------
+        nworkers : int
+            Number of concurrent simulations. Default: number of cores.
+        **grid :
+            Swept parameters and their values. Supported parameters are 
+            'vdd', 'Rs', 'temp' and 'corner'. E.g. sweep(vdd=[0.9,1.0,1.1], temp=[-40,27,125])
+
+        Returns
+        -------
+        sweep_result
+            Output data labelled with the swept parameters.
+
+        '''
+        for name in grid:
+            if name not in ['vdd', 'Rs', 'temp', 'corner']:
+                self.print_log(type='F', msg='Sweep over %s not supported' %(name))
+        dims=list(grid.keys())
+        coords=dict([ (name, list(values)) for name, values in grid.items() ])
+        shape=tuple([ len(coords[name]) for name in dims ])
+        duts=np.empty(shape,dtype=object)
+        for index in np.ndindex(*shape):
+            d=self.copy_for_sweep()
+            for name, i in zip(dims,index):
+                if name in ['vdd', 'Rs']:
+                    setattr(d,name,coords[name][i])
                 else:
-                    plotlist = []
+                    d.spicecorner[name]=coords[name][i]
+            duts[index]=d
+        # Points differing only in parameters the model does not depend on
+        # are simulated once
+        distinct={}
+        for d in duts.flat:
+            distinct.setdefault(repr(d.sweep_signature()),[]).append(d)
+        self.print_log(type='I', msg='Simulating %d distinct points of %d' %(len(distinct),duts.size))
+        runner=model_runner(self)
+        runner.duts=[ points[0] for points in distinct.values() ]
+        if nworkers:
+            runner.nworkers=nworkers
+        runner.run()
+        if runner.failed:
+            self.print_log(type='E', msg='%s sweep points failed' %(len(runner.failed)))
+        names=[ name for name in runner.collect if name in self.IOS.Members ]
+        for points in distinct.values():
+            for d in points[1:]:
+                for name in names:
+                    d.IOS.Members[name].Data=points[0].IOS.Members[name].Data
+        return sweep_result(dims=dims,coords=coords,duts=duts,names=names)
 
-                # Simulation command
-                _=spice_simcmd(self,sim='tran',plotlist=plotlist)
-                self.run_spice()
+    # Configuration copied to the points of a sweep
+    _sweep_attributes=['model', 'lang', 'tpd', 'lanes', 'bitpacked', 'nsamples', 'inplace', 
+            'cache', 'cachedir', 'cachesize', 'rtl_binary_io', 'rtl_reuse_build', 'rtl_phase_timing',
+            'spice_streaming', 'streamchunk', 'keep_waveforms', 'waveform_decimation', 
+            'power_metrics', 'spice_nproc', 'spice_maxnproc', 'spice_samples_per_thread', 
+            'reuse_workspace']
 
-            if self.par:
-                self.queue.put(self.IOS.Members)
+    def sweep_signature(self):
+        ''' Swept parameters that affect the outputs of the current model. 
+        Points of a sweep with equal signatures are simulated once.
+
+        '''
+        if self.model == 'py':
+            return ()
+        if self.model == 'event':
+            return (self.vdd, self.Rs)
+        if self.model in ['sv', 'icarus', 'verilator', 'vhdl', 'ghdl']:
+            return (self.Rs,)
+        return (self.vdd, self.Rs, sorted(self.spicecorner.items()))
+
+    def copy_for_sweep(self):
+        ''' Returns a copy of this entity sharing the input IOs, 
+        for simulation of a single point of a sweep.
+
+        '''
+        d=inverter(self)
+        for name in self._sweep_attributes:
+            setattr(d,name,getattr(self,name))
+        for name in ['spiceoptions', 'spiceparameters', 'spicecorner']:
+            setattr(d,name,dict(getattr(self,name)))
+        # Manual testbench and netlist lines of the user, lines defined by the
+        # entity itself are redefined by the copy
+        if hasattr(self,'rtlmisc'):
+            d.rtlmisc=[ line for line in self.rtlmisc if not line.startswith(self._binary_output_header) ]
+        if hasattr(self,'spicemisc'):
+            d.spicemisc=[ line for line in self.spicemisc if line not in self._spice_misc ]
+        for name in ['A', 'CLK', 'control_write']:
+            d.IOS.Members[name]=self.IOS.Members[name]
+        return d
+
+    def simulate(self):
+        ''' Launches the simulator defined by self.model and post-processes the results.
+
+        '''
+        if self.model in ['sv', 'icarus', 'verilator' ]:
+            self.run_rtl_timed()
+            self.close_rtl_session()
+            with self.tracer.span('postprocess'):
+                zname=self.rtl_ionames[1]
+                if zname in self.iofile_bundle.Members:
+                    words=self.IOS.Members[zname].Data[:,0:1].astype(int,copy=False)
+                else:
+                    words=self.read_binary_output()
+                self.IOS.Members['Z'].Data=self.unpack_lanes(words)
+        elif self.model=='vhdl' or self.model == 'ghdl':
+            self.run_rtl_timed()
+            self.close_rtl_session()
+            with self.tracer.span('postprocess'):
+                words=self.IOS.Members[self.rtl_ionames[1]].Data.astype(int,copy=False).reshape(-1,1)
+                self.IOS.Members['Z'].Data=self.unpack_lanes(words)
+        elif self.model in ['eldo','spectre','ngspice']:
+            # The simulator is given exactly the reserved number of threads
+            with self.corescheduler.reserve(self.spice_threads(),exact=bool(self.spice_nproc)) as nproc:
+                self.nproc=nproc
+                with self.tracer.span('run_spice',nproc=self.nproc):
+                    self.run_spice()
+            if self.spice_streaming:
+                with self.tracer.span('postprocess'):
+                    self.extract_streaming()
+            if self.power_metrics:
+                with self.tracer.span('power'):
+                    self.extract_power()
+
+    def define_spice_deck(self):
+        ''' Defines the static parts of the spice testbench: the supplies, the 
+        manual commands and the simulation command. They are defined once and 
+        reused in subsequent runs until self.model or self.vdd change. The 
+        sources of the stimulus are defined on every run.
+
+        '''
+        signature=(self.model,self.vdd)
+        if self._spice_deck == signature:
+            return
+        from spice import spice_dcsource, spice_simcmd
+
+        # Example of defining supplies (not used here because the example inverter has no supplies)
+        _=spice_dcsource(self,name='supply',value=self.vdd,pos='VDD',neg='VSS',extract=True)
+        _=spice_dcsource(self,name='ground',value=0,pos='VSS',neg='0')
+
+        # Adding a resistor between VDD and VSS to demonstrate power consumption extraction
+        # This also demonstrates how to inject manual commands in to the testbench
+        # Lines of a previous definition are replaced
+        for line in self._spice_misc:
+            if line in self.spicemisc:
+                self.spicemisc.remove(line)
+        self._spice_misc=[]
+        if self.model=='spectre':
+            self._spice_misc.append('simulator lang=spice')
+        self._spice_misc.append('Rtest VDD VSS 2000')
+        if self.model=='spectre':
+            self._spice_misc.append('simulator lang=spectre')
+        self.spicemisc.extend(self._spice_misc)
+        
+        # Plotting nodes for interactive waveform viewing.
+        # Spectre also supported, but without 'v()' specifiers.
+        # i.e. plotlist = ['A','Z']
+        if self.model == 'eldo':
+            plotlist = ['v(A)','v(Z)']
+        elif self.model == 'spectre':
+            plotlist = ['A','Z']
+        else:
+            plotlist = []
+
+        # Simulation command
+        _=spice_simcmd(self,sim='tran',plotlist=plotlist)
+        self._spice_deck=signature
+
+    def spice_threads(self):
+        ''' Number of threads requested for the spice simulation, 
+        self.spice_samples_per_thread samples of A per thread, at most
+        self.spice_maxnproc.
+
+        '''
+        if self.spice_nproc:
+            return self.spice_nproc
+        nsamples=len(self.IOS.Members['A'].Data)
+        return int(min(max(-(-nsamples//self.spice_samples_per_thread),1),self.spice_maxnproc))
+
+    def run_rtl_timed(self):
+        ''' Runs the rtl simulation in the span 'run_rtl'. If self.rtl_phase_timing
+        is True, the span is divided to the nested spans 'rtl_prepare' (testbench
+        and IO file generation), 'rtl_build' (compilation and elaboration), 
+        'rtl_simulate' and 'rtl_readback' (reading of the output IO files),
+        from time stamps written by the simulation command between its steps.
+
+        '''
+        self._rtl_stamps=None
+        if self.rtl_phase_timing and self.tracer.enabled:
+            fd,self._rtl_stamps=tempfile.mkstemp(prefix='inverter_stamps_')
+            os.close(fd)
+        try:
+            with self.tracer.span('run_rtl',reuse_build=self._rtl_session_built):
+                start=time.perf_counter_ns()
+                self.run_rtl()
+                stop=time.perf_counter_ns()
+                if self._rtl_stamps:
+                    # Stamps are in ns since the epoch
+                    offset=time.perf_counter_ns()-time.time_ns()
+                    with open(self._rtl_stamps) as f:
+                        stamps=[ int(line)+offset for line in f if line.strip().isdigit() ]
+                    if len(stamps) == 3:
+                        bounds=[start]+stamps+[stop]
+                        for name, begin, end in zip(['rtl_prepare', 'rtl_build', 'rtl_simulate', 'rtl_readback'],
+                                bounds[:-1],bounds[1:]):
+                            self.tracer.record(name,begin,end)
+                    else:
+                        self.print_log(type='W', msg='Time stamps of rtl phases not found')
+        finally:
+            if self._rtl_stamps:
+                os.remove(self._rtl_stamps)
+            self._rtl_stamps=None
+
+    def extract_streaming(self):
+        ''' Extracts the sampled and timed outputs Z, Z_RISE and A_DIG from the 
+        event waveforms of Z, A and CLK in chunks of self.streamchunk rows, 
+        with the same threshold, edge and trigger definitions as the 
+        corresponding spice_iofiles. 
+
+        The waveforms have been read whole by spice_iofile, the chunks bound 
+        only the temporaries of the extraction. The dense waveforms are kept 
+        only if self.keep_waveforms is True, decimated by self.waveform_decimation.
+
+        '''
+        vth=self.vdd/2
+        # All outputs are extracted in a single pass over the waveforms
+        engine=edge_engine()
+        engine.sample('Z','Z','CLK',vth,edgetype='rising',ioformat='dec')
+        engine.crossing('Z_RISE','Z',vth,edgetype='rising')
+        engine.sample('A_DIG','A','CLK',vth,edgetype='rising',ioformat='dec')
+        dense=['Z_ANA', 'A_OUT', 'CLK_OUT']
+        keep=dict([ (name, decimator(self.waveform_decimation)) for name in dense ])
+        for z, a, clk in zip(*[ read_chunks(self.IOS.Members[name].Data,self.streamchunk) for name in dense ]):
+            engine.feed({ 'Z' : z, 'A' : a, 'CLK' : clk })
+            if self.keep_waveforms:
+                for name, chunk in zip(dense,[z, a, clk]):
+                    keep[name].feed(chunk)
+        for name, data in engine.result().items():
+            self.IOS.Members[name].Data=data
+        for name in dense:
+            self.IOS.Members[name].Data=keep[name].result()
+
+    def supply_current(self):
+        ''' Extracted current of the supply source, as an array of (time, current) 
+        rows or a file of such rows. The current is looked up from self.extracts 
+        by the name of the source, 'supply'. None if not found.
+
+        '''
+        members=getattr(getattr(self,'extracts',None),'Members',{})
+        candidates=[ value for name, value in members.items() if 'supply' in str(name).lower() ]
+        # Extracts may also be grouped by quantity
+        for value in list(members.values()):
+            if isinstance(value,dict):
+                candidates+=[ item for name, item in value.items() if 'supply' in str(name).lower() ]
+        for value in candidates:
+            if isinstance(value,np.ndarray) and value.ndim == 2 and value.shape[1] >= 2:
+                return value
+            if isinstance(value,str) and os.path.isfile(value):
+                return value
+        return None
+
+    def extract_power(self):
+        ''' Integrates the power metrics of the supply from its current waveform. 
+        See power_metrics.
+
+        '''
+        source=self.supply_current()
+        if source is None:
+            self.print_log(type='W', msg='Supply current not found, power metrics not extracted')
+            return
+        self.IOS.Members['POWER'].Data=None
+        current=integrator()
+        try:
+            for chunk in read_chunks(source,self.streamchunk):
+                if chunk.ndim != 2 or chunk.shape[1] < 2:
+                    raise ValueError('rows are not of (time, current)')
+                current.feed(chunk)
+        except ValueError as e:
+            # E.g. a truncated last line of a file
+            self.print_log(type='E', msg='Supply current not readable: %s, power metrics not extracted' %(e))
+            return
+        # Empty or truncated waveforms would give a wrong energy
+        if not current.valid():
+            self.print_log(type='E', msg='Supply current waveform of %d rows is %s, power metrics not extracted'
+                    %(current.rows,'too short' if current.rows < 2 else 'not monotonic in time' 
+                        if not current.monotonic else 'not finite'))
+            return
+        result=current.result()
+        outval=self.IOS.Members['Z'].Data
+        transitions=0
+        if isinstance(outval,np.ndarray) and len(outval) > 1:
+            transitions=np.count_nonzero(np.diff(outval[:,0]))
+        energy=self.vdd*abs(result['integral'])
+        power=np.zeros(1,dtype=[('avg_power',float), ('energy',float), ('energy_per_transition',float),
+            ('peak_current',float), ('transitions',int), ('duration',float)])
+        power['avg_power']=energy/result['duration'] if result['duration'] > 0 else 0.0
+        power['energy']=energy
+        power['energy_per_transition']=energy/transitions if transitions else np.nan
+        power['peak_current']=result['peak']
+        power['transitions']=transitions
+        power['duration']=result['duration']
+        self.IOS.Members['POWER'].Data=power
+        if not self.keep_waveforms:
+            # Only the metrics are kept
+            for name, value in list(getattr(self.extracts,'Members',{}).items()):
+                if value is source:
+                    self.extracts.Members[name]=None
+                elif isinstance(value,dict):
+                    for key in [ key for key, item in value.items() if item is source ]:
+                        value[key]=None
+
+    def use_workspace(self):
+        ''' Runs the simulation in the reused directory of the slot of this 
+        process. See reuse_workspace. The run name and the preserve flags are 
+        restored by release_workspace.
+
+        '''
+        self.release_workspace()
+        rtlmodel=self.model in ['sv', 'icarus', 'verilator', 'vhdl', 'ghdl']
+        flags=['preserve_rtlfiles' if rtlmodel else 'preserve_spicefiles', 'preserve_iofiles']
+        self._workspace_restore=dict([ (name, getattr(self,name)) for name in ['runname']+flags ])
+        self.runname=self.workspaces.acquire()
+        self.workspaces.attach(self.rtlsimpath if rtlmodel else self.spicesimpath)
+        # Files are overwritten by the next run instead of deleted
+        for name in flags:
+            setattr(self,name,True)
+        self.tracer.count('workspace_reuse',1)
+
+    def release_workspace(self):
+        ''' Restores the run name and the preserve flags set by use_workspace.
+
+        '''
+        for name, value in self._workspace_restore.items():
+            setattr(self,name,value)
+        self._workspace_restore={}
+
+    def rtl_session_key(self):
+        ''' Fingerprint of the compiled RTL simulation. Covers the 
+        simulator, the language, the RTL sources, self.rtlparameters and
+        the testbench code: self.rtl_binary_io and the lines of self.rtlmisc.
+        The binary output block is covered by self.rtl_binary_io, as its 
+        file path depends on the session.
+
+        '''
+        misc=[ line for line in self.rtlmisc if not line.startswith(self._binary_output_header) ]
+        h=hashlib.sha256()
+        h.update(repr((self.model, self.lang, sorted(self.rtlparameters.items()), 
+            bool(self.rtl_binary_io), misc)).encode())
+        for srcdir in ['sv', 'vhdl']:
+            path=os.path.join(self.entitypath,srcdir)
+            if os.path.isdir(path):
+                for f in sorted(os.listdir(path)):
+                    with open(os.path.join(path,f),'rb') as fid:
+                        h.update(f.encode())
+                        h.update(fid.read())
+        return h.hexdigest()
+
+    def open_rtl_session(self):
+        ''' Opens a compile-once, run-many RTL simulation session. 
+
+        The simulation is run in a persistent directory named after
+        rtl_session_key. If the design has already been built there, 
+        compilation and elaboration steps are removed from self.rtlcmd, 
+        and only the testbench IO files are rewritten for the run. 
+        The directory is locked until the session is closed, so 
+        concurrent runs do not build or run in it at the same time.
+
+        '''
+        self.release_rtl_session()
+        self._rtl_session=dict([ (name, getattr(self,name)) for name in ['runname', 'preserve_rtlfiles'] ])
+        self.runname='rtlsession_%s' %(self.rtl_session_key()[:16])
+        self.preserve_rtlfiles=True
+        lock=open(os.path.join(self.rtlsimpath,'.rtl_session_lock'),'a')
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        self._rtl_session['lock']=lock
+        self._rtl_session_built=os.path.isfile(os.path.join(self.rtlsimpath,'.rtl_session_built'))
+        if self._rtl_session_built:
+            self.print_log(type='I', msg='Reusing RTL build in %s' %(self.rtlsimpath))
+
+    def close_rtl_session(self):
+        ''' Marks the build of the current session as complete after a 
+        successful run, and releases the session.
+
+        '''
+        if self.rtl_reuse_build and not self._rtl_session_built:
+            open(os.path.join(self.rtlsimpath,'.rtl_session_built'),'w').close()
+        self.release_rtl_session()
+
+    def release_rtl_session(self):
+        ''' Unlocks the session directory and restores the run name and
+        self.preserve_rtlfiles set by open_rtl_session.
+
+        '''
+        lock=self._rtl_session.pop('lock',None)
+        if lock is not None:
+            fcntl.flock(lock,fcntl.LOCK_UN)
+            lock.close()
+        for name, value in self._rtl_session.items():
+            setattr(self,name,value)
+        self._rtl_session={}
+        self._rtl_session_built=False
+
+    @property
+    def rtlcmd(self):
+        ''' Simulation command of rtl. Compilation and elaboration steps are 
+        omitted when an existing build is reused. Time stamps of the phases
+        are written between the steps during run_rtl_timed.
+
+        '''
+        cmd=super(inverter,type(self)).rtlcmd.fget(self)
+        steps=[ step.strip() for step in cmd.split('&&') ]
+        if getattr(self,'_rtl_session_built',False):
+            steps=[ step for step in steps if not step.startswith(self._rtl_build_commands) ]
+        stamps=getattr(self,'_rtl_stamps',None)
+        if stamps:
+            # Time stamps after the leading directory changes, after the last
+            # build step and at the end
+            stamp='date +%%s%%N >> %s' %(stamps)
+            start=0
+            while start < len(steps) and steps[start].startswith('cd '):
+                start+=1
+            built=max([ i+1 for i, step in enumerate(steps) 
+                if step.startswith(self._rtl_build_commands) ]+[start])
+            steps=steps[:start]+[stamp]+steps[start:built]+[stamp]+steps[built:]+[stamp]
+        return ' && '.join(steps)
+
+    @rtlcmd.setter
+    def rtlcmd(self,value):
+        super(inverter,type(self)).rtlcmd.fset(self,value)
+
+    # Commands that compile or elaborate the design
+    _rtl_build_commands=('iverilog', 'verilator', 'make', 'ghdl -a', 'ghdl -i', 'ghdl -m', 
+            'ghdl -e', 'vlib', 'vmap', 'vlog', 'vcom', 'vopt')
+
+    def define_binary_output(self):
+        ''' Defines the testbench code writing output Z as raw little-endian 
+        32-bit words, one per sample, with $fwrite format %u. The samples are 
+        written at the falling edge of the clock after initdone, as with the 
+        text IO file.
+
+        '''
+        if self.rtl_reuse_build:
+            # Path is compiled in to the reused build
+            self._binary_output_file=os.path.join(self.rtlsimpath,'Z.bin')
+        else:
+            fd,self._binary_output_file=tempfile.mkstemp(prefix='inverter_Z_',suffix='.bin')
+            os.close(fd)
+        if self.rtl_reuse_build and os.path.exists(self._binary_output_file):
+            # Output of an earlier run is not read if this run fails
+            os.remove(self._binary_output_file)
+        self.remove_binary_output()
+        self.rtlmisc.append(self._binary_output_header + '\n'
+            + 'integer f_Z_bin;\n'
+            + 'initial f_Z_bin = $fopen("%s", "wb");\n' %(self._binary_output_file)
+            + 'always @(negedge clock) begin\n'
+            + '    if ( initdone ) begin\n'
+            + '        $fwrite(f_Z_bin, "%u", Z);\n'
+            + '    end\n'
+            + 'end\n'
+            + 'final $fclose(f_Z_bin);\n'
+            )
+
+    _binary_output_header='// Binary output of Z'
+
+    def remove_binary_output(self):
+        ''' Removes the testbench code of the binary output from self.rtlmisc.
+
+        '''
+        self.rtlmisc=[ line for line in self.rtlmisc if not line.startswith(self._binary_output_header) ]
+
+    def read_binary_output(self):
+        ''' Maps the binary output file of Z to an array without copying. 
+        The file is unlinked after mapping unless self.preserve_iofiles 
+        is True, the mapping keeps the data available.
+
+        Returns
+        -------
+        ndarray
+            Output words of shape (n,1)
+
+        '''
+        file=self._binary_output_file
+        self.tracer.count('binary_read_bytes',os.path.getsize(file))
+        if os.path.getsize(file) > 0:
+            data=np.memmap(file,dtype='<u4',mode='r').reshape(-1,1)
+        else:
+            data=np.empty((0,1),dtype='<u4')
+        if not self.preserve_iofiles:
+            os.remove(file)
+        else:
+            self.print_log(type='I', msg='Preserving binary output file %s' %(file))
+        return data
+
+    @property
+    def rtl_ionames(self):
+        ''' Names of the IOS members of the rtl IO files of A and Z. With 
+        multiple lanes, the lanes are exchanged with the simulator as bus
+        words through the members A_BUS and Z_BUS.
+
+        '''
+        if self.lanes > 1:
+            return ('A_BUS', 'Z_BUS')
+        return ('A', 'Z')
+
+    def pack_lanes(self,data):
+        ''' Packs samples of shape (samples, lanes) to bus words of shape (samples,1). 
+        Lane n is bit n of the word.
+
+        '''
+        data=np.asarray(data).reshape(len(data),-1)
+        if data.shape[1] != self.lanes:
+            self.print_log(type='F', msg='Data has %s lanes, expected %s' %(data.shape[1],self.lanes))
+        weights=np.left_shift(np.int64(1),np.arange(self.lanes,dtype=np.int64))
+        return ((data.astype(np.int64) & 1) @ weights).reshape(-1,1)
+
+    def unpack_lanes(self,words):
+        ''' Unpacks bus words of shape (samples,1) to samples of shape (samples, lanes). 
+        Single lane data is returned as is.
+
+        '''
+        if self.lanes == 1:
+            return words
+        return (words.reshape(-1,1).astype(np.int64) >> np.arange(self.lanes,dtype=np.int64)) & 1
+
+    @property
+    def outputs(self):
+        ''' Names of the output IOs of the current simulation.
+
+        '''
+        names=[ name for name, f in self.iofile_bundle.Members.items() 
+                if getattr(f,'dir',None) == 'out' and name in self.IOS.Members and name != 'Z_BUS' ]
+        if self.model in ['sv', 'icarus', 'verilator', 'vhdl', 'ghdl'] and 'Z' not in names:
+            names.append('Z')
+        if self.model in ['eldo','spectre','ngspice'] and self.spice_streaming:
+            names+=['Z', 'Z_RISE', 'A_DIG']
+        if self.model in ['eldo','spectre','ngspice'] and self.power_metrics:
+            names.append('POWER')
+        return names
+
+    def cache_key(self):
+        ''' Key of the simulation cache. Covers the input data, the parameters
+        of the model, the manual testbench and netlist lines and the contents 
+        of the source files.
+
+        '''
+        params={ 'model' : self.model, 'lang' : self.lang, 'Rs' : self.Rs, 'vdd' : self.vdd, 'lanes' : self.lanes }
+        if self.model in ['sv', 'icarus', 'verilator', 'vhdl', 'ghdl']:
+            # Backend attributes are defined once loaded. Path of the binary output 
+            # file differs from run to run, the block is covered by rtl_binary_io
+            params.update({ 'rtlparameters' : sorted(getattr(self,'rtlparameters',{}).items()),
+                'rtlmisc' : [ line for line in getattr(self,'rtlmisc',[]) if not line.startswith(self._binary_output_header) ],
+                'rtl_binary_io' : bool(self.rtl_binary_io) })
+        if self.model in ['eldo','spectre','ngspice']:
+            params.update({ 'spicemisc' : list(getattr(self,'spicemisc',[])),
+                'spiceoptions' : sorted(self.spiceoptions.items()),
+                'spiceparameters' : sorted(self.spiceparameters.items()),
+                'spicecorner' : sorted(self.spicecorner.items()),
+                # Define the set of outputs and their contents
+                'power_metrics' : self.power_metrics, 'spice_streaming' : self.spice_streaming,
+                'keep_waveforms' : self.keep_waveforms, 'waveform_decimation' : self.waveform_decimation })
+        arrays={}
+        for name in ['A', 'CLK', 'control_write']:
+            data=self.IOS.Members[name].Data
+            # Control IO points to the control file, the data is in the file
+            if hasattr(data,'Data'):
+                data=data.Data
+            if isinstance(data,np.ndarray):
+                arrays[name]=data
+        files=[]
+        for srcdir in ['sv', 'vhdl', 'spice']:
+            path=os.path.join(self.entitypath,srcdir)
+            if os.path.isdir(path):
+                files+=[ os.path.join(path,f) for f in os.listdir(path) 
+                        if os.path.isfile(os.path.join(path,f)) ]
+        return self._simcache.key(params,arrays,files)
+
+    @property
+    def _simcache(self):
+        cachedir=self.cachedir if self.cachedir else os.path.join(self.entitypath,'simcache')
+        if not hasattr(self,'_simcache_instance') or self._simcache_instance.path != cachedir:
+            self._simcache_instance=simcache(self,path=cachedir)
+        self._simcache_instance.maxsize=self.cachesize
+        return self._simcache_instance
+
+    def load_cached(self):
+        ''' Loads the outputs from the simulation cache.
+
+        Returns
+        -------
+        bool
+            True if the results were found in the cache.
+
+        '''
+        self._cachekey=self.cache_key()
+        cached=self._simcache.load(self._cachekey)
+        if cached is None:
+            return False
+        for name, data in cached.items():
+            self.IOS.Members[name].Data=data
+        self.print_log(type='I', msg='Loaded results of %s simulation from cache' %(self.model))
+        return True
+
+    def store_cached(self):
+        ''' Stores the outputs to the simulation cache.
+
+        '''
+        self._simcache.store(self._cachekey, 
+                dict([ (name, self.IOS.Members[name].Data) for name in self.outputs ]))
 
     def define_io_conditions(self):
         '''This overloads the method called by run_rtl method. It defines the read/write conditions for the files
@@ -290,29 +1413,55 @@ class inverter(rtl,spice,thesdk):
         '''
         if self.lang == 'sv':
             # Input A is read to verilog simulation after 'initdone' is set to 1 by controller
-            self.iofile_bundle.Members['A'].rtl_io_condition='initdone'
+            self.iofile_bundle.Members[self.rtl_ionames[0]].rtl_io_condition='initdone'
             # Output is read to verilog simulation when all of the outputs are valid, 
             # and after 'initdone' is set to 1 by controller
-            self.iofile_bundle.Members['Z'].rtl_io_condition_append(cond='&& initdone')
+            if self.rtl_ionames[1] in self.iofile_bundle.Members:
+                self.iofile_bundle.Members[self.rtl_ionames[1]].rtl_io_condition_append(cond='&& initdone')
         elif self.lang == 'vhdl':
-            self.iofile_bundle.Members['A'].rtl_io_condition='(initdone = \'1\')'
+            self.iofile_bundle.Members[self.rtl_ionames[0]].rtl_io_condition='(initdone = \'1\')'
             # Output is read to verilog simulation when all of the outputs are valid, 
             # and after 'initdone' is set to 1 by controller
-            self.iofile_bundle.Members['Z'].rtl_io_condition_append(cond='and initdone = \'1\'')
+            self.iofile_bundle.Members[self.rtl_ionames[1]].rtl_io_condition_append(cond='and initdone = \'1\'')
+
+def _backend_class():
+    ''' Class of the inverter with the rtl and spice backends. 
+    Created on first call.
+
+    '''
+    global _backend
+    if _backend is None:
+        from rtl import rtl
+        from spice import spice
+        _backend=type('inverter',(inverter,rtl,spice),
+                { '__module__' : inverter.__module__, '__qualname__' : '_inverter_backend' })
+    return _backend
+
+_backend=None
+
+def __getattr__(name):
+    # Instances are pickled by reference to the module attribute _inverter_backend,
+    # the class is created when unpickled in a fresh interpreter
+    if name == '_inverter_backend':
+        return _backend_class()
+    raise AttributeError('module %r has no attribute %r' %(__name__,name))
 
 if __name__=="__main__":
     import argparse
-    import matplotlib.pyplot as plt
     from inverter import *
-    from inverter.controller import controller as inverter_controller
     from inverter.signal_source import signal_source
-    from inverter.signal_plotter import signal_plotter
-    import pdb
+    from inverter.signal_plotter import signal_plotter, plot_batch
+    from inverter.model_runner import model_runner
+    from inverter.equivalence_checker import equivalence_checker
 
     # Implement argument parser
     parser = argparse.ArgumentParser(description='Parse selectors')
     parser.add_argument('--show', dest='show', type=bool, nargs='?', const = True, 
             default=False,help='Show figures on screen')
+    parser.add_argument('--nworkers', dest='nworkers', type=int, default=None,
+            help='Number of models simulated concurrently. Default: number of cores')
+    parser.add_argument('--timeout', dest='timeout', type=float, default=None,
+            help='Timeout for a single model simulation in seconds. Default: no timeout')
     args=parser.parse_args()
 
     length=2**8
@@ -320,14 +1469,17 @@ if __name__=="__main__":
     lang='sv'
     #Testbench vhdl
     #lang='vhdl'
-    controller=inverter_controller(lang=lang)
-    controller.Rs=rs
-    #controller.reset()
-    #controller.step_time()
-    controller.start_datafeed()
-    #models=['py','sv','icarus', 'verilator', 'ghdl', 'vhdl','eldo','spectre', 'ngspice']
+    #models=['py','event','sv','icarus', 'verilator', 'ghdl', 'vhdl','eldo','spectre', 'ngspice']
     #By default, we set only open souce simulators
-    models=['py', 'icarus', 'verilator', 'ghdl', 'ngspice']
+    models=['py', 'event', 'icarus', 'verilator', 'ghdl', 'ngspice']
+    if set(models) & set(['sv', 'icarus', 'verilator', 'ghdl', 'vhdl']):
+        # Controller is an rtl entity, imported only if rtl models are run
+        from inverter.controller import controller as inverter_controller
+        controller=inverter_controller(lang=lang)
+        controller.Rs=rs
+        #controller.reset()
+        #controller.step_time()
+        controller.start_datafeed()
     # Here we instantiate the signal source
     duts=[]
     plotters=[]
@@ -361,7 +1513,8 @@ if __name__=="__main__":
         d.IOS.Members['A']=s_source.IOS.Members['data']
         # This connects the clock to the output of the signal source
         d.IOS.Members['CLK']=s_source.IOS.Members['clk']
-        d.IOS.Members['control_write']=controller.IOS.Members['control_write']
+        if model in ['sv', 'icarus', 'verilator', 'ghdl', 'vhdl']:
+            d.IOS.Members['control_write']=controller.IOS.Members['control_write']
         ## Add plotters
         p=signal_plotter()
         plotters.append(p) 
@@ -380,15 +1533,65 @@ if __name__=="__main__":
     s_source.run() # Creates the data to the output
     for d in duts:
         d.init()
-        d.run()
+    # Models are simulated concurrently in separate processes
+    runner=model_runner()
+    runner.duts=duts
+    if args.nworkers:
+        runner.nworkers=args.nworkers
+    runner.timeout=args.timeout
+    runner.run()
+    # Outputs of the models are checked against the python model
+    mismatching=[]
+    reference=[ d for d in duts if d.model=='py' ]
+    for d in duts:
+        if not reference or d in reference or d in runner.failed:
+            continue
+        checker=equivalence_checker()
+        checker.IOS.Members['ref']=reference[0].IOS.Members['Z']
+        checker.IOS.Members['dut']=d.IOS.Members['Z']
+        checker.run()
+        if checker.passed:
+            d.print_log(type='I', msg='Model %s matches py' %(d.model))
+        else:
+            d.print_log(type='E', msg='Model %s does not match py' %(d.model))
+            mismatching.append(d)
+    # Incremental bit-packed run is checked against a full run
+    packed=np.packbits(s_source.IOS.Members['data'].Data[:,0].astype(np.uint8)).reshape(-1,1)
+    full=inverter()
+    full.bitpacked=True
+    full.nsamples=length-3
+    full.IOS.Members['A'].Data=packed
+    full.run()
+    d=inverter()
+    d.bitpacked=True
+    d.nsamples=length-3
+    d.incremental=True
+    d.IOS.Members['A'].Data=packed
+    d.run()
+    d.IOS.Members['A'].Data=packed.copy()
+    d.IOS.Members['A'].Data[-1]^=0xFF
+    d.run()
+    full.IOS.Members['A'].Data=d.IOS.Members['A'].Data
+    full.run()
+    if not np.array_equal(d.IOS.Members['Z'].Data,full.IOS.Members['Z'].Data):
+        d.print_log(type='E', msg='Incremental bit-packed run does not match a full run')
+        mismatching.append(d)
+
     for p in plotters:
         p.init()
-        p.run()
+    if args.show:
+        for p in plotters:
+            p.run()
+    else:
+        # Figures are rendered concurrently without a display
+        plot_batch(plotters,nworkers=args.nworkers)
 
      #This is here to keep the images visible
      #For batch execution, you should comment the following line 
     if args.show:
        input()
     #This is to have exit status for succesfuulexecution
+    if runner.failed or mismatching:
+        sys.exit(1)
     sys.exit(0)
 
@@ -0,0 +1,371 @@
+"""
+=========
+Benchmark
+=========
+
+Benchmark of the simulation models of the inverter. 
+
+Every model is run at geometrically increasing data lengths, each
+measurement in its own process to isolate the peak memory usage. The
+wall-clock time is recorded per phase, with the run phase broken down by
+the tracer of the inverter, and the results are written as
+JSON. For rtl models, the rtl simulation is further divided to the
+generation of the testbench and IO files, compilation and elaboration,
+simulation and reading of the outputs, from time stamps written by the
+simulation command between its steps. The run phases can be compared
+against a stored baseline, exceeding the regression threshold gives a
+non-zero exit status. A measurement that crashes or times out is
+recorded as an error.
+
+The import time of the inverter package is measured in a fresh
+interpreter. The toolchains (rtl, spice, matplotlib) must not be
+loaded by the import, if they are, the benchmark fails.
+
+Usage::
+
+    python3 benchmark.py --models py icarus --maxlength 65536 --output bench.json
+    python3 benchmark.py --baseline bench.json --threshold 0.2
+    python3 benchmark.py --importtime --models
+
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import platform
+import resource
+import subprocess
+import multiprocessing
+if not (os.path.abspath('../../thesdk') in sys.path):
+    sys.path.append(os.path.abspath('../../thesdk'))
+
+from thesdk import *
+
+import numpy as np
+
+class benchmark(thesdk):
+    def _classfile(self):
+        return os.path.dirname(os.path.realpath(__file__)) + "/"+__name__
+
+    def __init__(self,*arg): 
+        """ Benchmark parameters and attributes
+            Parameters
+            ----------
+                *arg : 
+                If any arguments are defined, the first one should be the parent instance
+
+            Attributes
+            ----------
+            models : list
+                Simulation models to benchmark. Default ['py', 'icarus', 'verilator', 'ghdl', 'ngspice']
+
+            lengths : list
+                Data lengths to benchmark. Default 2**8, 2**10, ..., 2**16
+
+            lang : str
+                Testbench language of Verilog simulators. Default 'sv'
+
+            plot : bool
+                If True, the plotting phase is included. Default True
+
+            baseline : str
+                Path of a JSON file of earlier results to compare with. Default None
+
+            threshold : float
+                Relative increase of the time of the run phase over the baseline considered
+                as a regression. Default 0.2
+
+            timeout : float
+                Timeout of a single measurement in seconds, or None for no timeout. Default 3600
+
+            importtime : bool
+                If True, the import time of the package is measured. Default False
+
+            importrepeat : int
+                Number of fresh interpreters the import time is measured in. Default 5
+
+            heavymodules : list
+                Modules that must not be loaded by importing the package.
+                Default ['rtl', 'spice', 'matplotlib']
+
+            results : list
+                Records of the measurements. Set by run.
+
+            regressions : list
+                Records exceeding the baseline. Set by run.
+
+        """
+        self.proplist = ['Rs'] # Properties that can be propagated from parent
+        self.Rs = 100e6
+        self.models = ['py', 'icarus', 'verilator', 'ghdl', 'ngspice']
+        self.lengths = [ 2**n for n in range(8,17,2) ]
+        self.lang = 'sv'
+        self.plot = True
+        self.baseline = None
+        self.threshold = 0.2
+        self.timeout = 3600
+        self.importtime = False
+        self.importrepeat = 5
+        self.heavymodules = ['rtl', 'spice', 'matplotlib']
+        self.results = []
+        self.regressions = []
+        self.model = 'py'
+
+        if len(arg)>=1:
+            parent=arg[0]
+            self.copy_propval(parent,self.proplist)
+            self.parent=parent
+
+    def init(self):
+        """ Method to re-initialize the structure if the attribute values are changed after creation.
+
+        """
+        pass #Currently nothing to add
+
+    def measure(self,model,length):
+        ''' Measures a single model at a single data length.
+
+        Returns
+        -------
+        dict
+            Record of the measurement.
+
+        '''
+        from inverter import inverter
+        from inverter.signal_source import signal_source
+        from inverter.signal_plotter import signal_plotter
+        phases={}
+        start=time.perf_counter()
+        s_source=signal_source()
+        s_source.length=length
+        s_source.seed=0
+        s_source.run()
+        phases['source']=time.perf_counter()-start
+
+        d=inverter()
+        d.model=model
+        d.lang='vhdl' if model == 'ghdl' else self.lang
+        d.Rs=self.Rs
+        d.IOS.Members['A']=s_source.IOS.Members['data']
+        d.IOS.Members['CLK']=s_source.IOS.Members['clk']
+        if model in ['sv', 'icarus', 'verilator', 'vhdl', 'ghdl']:
+            from inverter.controller import controller as inverter_controller
+            controller=inverter_controller(lang=d.lang)
+            controller.Rs=self.Rs
+            controller.start_datafeed()
+            d.IOS.Members['control_write']=controller.IOS.Members['control_write']
+            d.rtl_phase_timing=True
+        d.init()
+        start=time.perf_counter()
+        d.run()
+        phases['run']=time.perf_counter()-start
+
+        if self.plot:
+            p=signal_plotter()
+            p.plotmodel=model
+            p.plotprefix='bench_'
+            p.plotformat='png'
+            p.headless=True
+            p.plotvdd=d.vdd
+            p.Rs=self.Rs
+            for name in ['A', 'Z', 'A_OUT', 'A_DIG', 'Z_ANA', 'Z_RISE']:
+                p.IOS.Members[name]=d.IOS.Members[name]
+            start=time.perf_counter()
+            p.run()
+            phases['plot']=time.perf_counter()-start
+
+        return {
+                'model' : model,
+                'length' : length,
+                'phases' : phases,
+                'total' : sum(phases.values()),
+                # Breakdown of the run phase
+                'run_phases' : d.tracer.summary(),
+                'counters' : d.tracer.counters,
+                # ru_maxrss is in kilobytes on Linux
+                'maxrss_kib' : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                'maxrss_children_kib' : resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+                }
+
+    def measure_import(self):
+        ''' Measures the import time of the inverter package in fresh interpreters.
+
+        Returns
+        -------
+        dict
+            Record of the measurement. The 'loaded' field lists the heavy
+            modules loaded by the import.
+
+        '''
+        script=('import sys, json, time\n'
+                'start=time.perf_counter()\n'
+                'import inverter\n'
+                'elapsed=time.perf_counter()-start\n'
+                'print(json.dumps([elapsed, sorted(set(m.split(\'.\')[0] for m in sys.modules) & set(%r))]))\n'
+                %(self.heavymodules))
+        # The package is imported from its parent directory
+        cwd=os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+        env=dict(os.environ)
+        env['PYTHONPATH']=os.pathsep.join([cwd,os.path.abspath('../../thesdk')]
+                +[ p for p in [env.get('PYTHONPATH')] if p ])
+        times=[]
+        loaded=[]
+        for i in range(self.importrepeat):
+            out=subprocess.run([sys.executable, '-c', script],cwd=cwd,env=env,
+                    stdout=subprocess.PIPE,check=True,universal_newlines=True).stdout
+            elapsed,loaded=json.loads(out.strip().splitlines()[-1])
+            times.append(elapsed)
+        record={
+                'model' : 'import',
+                'length' : 0,
+                'phases' : { 'import' : min(times) },
+                'total' : min(times),
+                'loaded' : loaded,
+                }
+        if loaded:
+            record['error']='Import of inverter loads %s' %(', '.join(loaded))
+        return record
+
+    def _measure_in_process(self,que,model,length):
+        try:
+            que.put(self.measure(model,length))
+        except BaseException as e:
+            que.put({ 'model' : model, 'length' : length, 'error' : repr(e) })
+
+    def _wait_record(self,que,proc,model,length):
+        ''' Waits for the record of a measurement process. A process that exits 
+        without a record or exceeds self.timeout gives an error record.
+
+        '''
+        deadline=None if self.timeout is None else time.monotonic()+self.timeout
+        while True:
+            try:
+                return que.get(timeout=1)
+            except queue.Empty:
+                pass
+            if not proc.is_alive():
+                # The record may have been put just before the exit
+                try:
+                    return que.get(timeout=1)
+                except queue.Empty:
+                    return { 'model' : model, 'length' : length, 
+                            'error' : 'Process exited with code %s' %(proc.exitcode) }
+            if deadline is not None and time.monotonic() > deadline:
+                proc.terminate()
+                return { 'model' : model, 'length' : length, 
+                        'error' : 'Timeout after %s s' %(self.timeout) }
+
+    def compare(self,baseline):
+        ''' Compares the run phases of self.results to baseline records and returns 
+        the regressions. The source and plotting phases are not compared.
+
+        '''
+        reference=dict([ ((r['model'],r['length']), r) for r in baseline if 'error' not in r ])
+        regressions=[]
+        for record in self.results:
+            ref=reference.get((record['model'],record['length']),None)
+            if ref is None or 'error' in record:
+                continue
+            # Import time is recorded as the import phase
+            phase='import' if record['model'] == 'import' else 'run'
+            elapsed, refelapsed=record['phases'].get(phase,0.0), ref['phases'].get(phase,0.0)
+            ratio=elapsed/refelapsed if refelapsed > 0 else 1.0
+            record['baseline_ratio']=ratio
+            if ratio > 1+self.threshold:
+                regressions.append(record)
+                self.print_log(type='W', msg='Regression in model %s at length %s: %.3f s vs. %.3f s' 
+                        %(record['model'],record['length'],elapsed,refelapsed))
+        return regressions
+
+    def main(self):
+        ''' Runs the measurements, each in its own process, and compares them
+        to the baseline if given.
+
+        '''
+        self.results=[]
+        if self.importtime:
+            record=self.measure_import()
+            if 'error' in record:
+                self.print_log(type='E', msg=record['error'])
+            else:
+                self.print_log(type='I', msg='Import: %.3f s' %(record['total']))
+            self.results.append(record)
+        for model in self.models:
+            for length in self.lengths:
+                que=multiprocessing.Queue()
+                proc=multiprocessing.Process(target=self._measure_in_process,args=(que,model,length))
+                proc.start()
+                record=self._wait_record(que,proc,model,length)
+                proc.join()
+                if 'error' in record:
+                    self.print_log(type='E', msg='Model %s at length %s failed: %s' 
+                            %(model,length,record['error']))
+                else:
+                    self.print_log(type='I', msg='Model %s at length %s: %.3f s' 
+                            %(model,length,record['total']))
+                self.results.append(record)
+        self.regressions=[]
+        if self.baseline:
+            with open(self.baseline) as f:
+                self.regressions=self.compare(json.load(f)['records'])
+
+    def dump(self,file):
+        ''' Writes the results to a JSON file.
+
+        '''
+        with open(file,'w') as f:
+            json.dump({ 
+                'host' : platform.node(),
+                'python' : platform.python_version(),
+                'numpy' : np.__version__,
+                'time' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'records' : self.results 
+                }, f, indent=2)
+
+    def run(self,*arg):
+        if self.model=='py':
+            self.main()
+        else:
+            self.print_log(type='E', msg='Model %s not supported' %(self.model))
+
+if __name__=="__main__":
+    import argparse
+    from inverter.benchmark import benchmark
+
+    parser = argparse.ArgumentParser(description='Benchmark the inverter models')
+    parser.add_argument('--models', dest='models', nargs='*', 
+            default=['py', 'icarus', 'verilator', 'ghdl', 'ngspice'], help='Models to benchmark')
+    parser.add_argument('--minlength', dest='minlength', type=int, default=2**8, help='Shortest data length')
+    parser.add_argument('--maxlength', dest='maxlength', type=int, default=2**16, help='Longest data length')
+    parser.add_argument('--factor', dest='factor', type=int, default=4, help='Ratio of consecutive lengths')
+    parser.add_argument('--noplot', dest='plot', action='store_false', help='Skip the plotting phase')
+    parser.add_argument('--importtime', dest='importtime', action='store_true', 
+            help='Measure the import time of the package')
+    parser.add_argument('--output', dest='output', default=None, help='JSON file for the results')
+    parser.add_argument('--baseline', dest='baseline', default=None, help='JSON file of baseline results')
+    parser.add_argument('--threshold', dest='threshold', type=float, default=0.2, 
+            help='Relative slowdown of the run phase considered as a regression')
+    parser.add_argument('--timeout', dest='timeout', type=float, default=3600, 
+            help='Timeout of a single measurement in seconds')
+    args=parser.parse_args()
+
+    b=benchmark()
+    b.models=args.models
+    b.lengths=[]
+    length=args.minlength
+    while length <= args.maxlength:
+        b.lengths.append(length)
+        length*=args.factor
+    b.plot=args.plot
+    b.importtime=args.importtime
+    b.baseline=args.baseline
+    b.threshold=args.threshold
+    b.timeout=args.timeout
+    b.run()
+    if args.output:
+        b.dump(args.output)
+    if b.regressions or any([ 'error' in r for r in b.results ]):
+        sys.exit(1)
+    sys.exit(0)
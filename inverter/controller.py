@@ -130,6 +130,96 @@ class controller(rtl):
         for name in [ 'reset', ]:
             f.set_control_data(time=self.time,name=name,val=0)
 
+    def set_control_schedule(self,time,name,val):
+        ''' Adds a sequence of control events with a single vectorized update 
+        of the control data. Equivalent to calling set_control_data for every 
+        event in the order of time, but without growing the data one row at 
+        a time. 
+
+        Parameters
+        ----------
+        time : array_like
+            Times of the events in simulation units. Must not precede the 
+            last existing event.
+        name : array_like
+            Names of the controlled signals
+        val : array_like
+            Values of the signals
+
+        '''
+        f=self.iofile_bundle.Members['control_write']
+        columns=[ connector.name for connector in f.rtl_connectors ]
+        time=np.asarray(time,dtype=np.int64).ravel()
+        name=np.asarray(name).ravel()
+        val=np.asarray(val,dtype=np.int64).ravel()
+        if not (len(time) == len(name) == len(val)):
+            self.print_log(type='F', msg='Lengths of time, name and val must match')
+        if len(time) == 0:
+            return
+        unknown=np.setdiff1d(name,columns)
+        if len(unknown) > 0:
+            self.print_log(type='F', msg='Signals %s not controlled by %s' %(list(unknown),f.name))
+        # Events at equal times are applied in the given order
+        order=np.argsort(time,kind='stable')
+        time=time[order]
+        name=name[order]
+        val=val[order]
+        current=np.asarray(f.Data)
+        if current.size > 0:
+            current=current.reshape(-1,len(columns)+1)
+            last=current[-1,1:]
+            if time[0] < current[-1,0]:
+                self.print_log(type='F', msg='Control events must not precede the existing ones')
+        else:
+            last=np.zeros(len(columns),dtype=np.int64)
+        rowtimes,row=np.unique(time,return_inverse=True)
+        data=np.empty((len(rowtimes),len(columns)+1),dtype=np.int64)
+        data[:,0]=rowtimes
+        events=np.arange(len(time))
+        for col, signal in enumerate(columns):
+            mask=name == signal
+            # Index of the latest event of this signal at or before every row
+            latest=np.full(len(rowtimes),-1,dtype=np.int64)
+            np.maximum.at(latest,row[mask],events[mask])
+            latest=np.maximum.accumulate(latest)
+            data[:,col+1]=np.where(latest >= 0,val[np.maximum(latest,0)],last[col])
+        if current.size > 0:
+            # Events at the time of the last existing row update that row
+            if rowtimes[0] == current[-1,0]:
+                current=current[:-1]
+            data=np.concatenate((current,data))
+        f.Data=data
+        self.time=max(self.time,int(rowtimes[-1]))
+
+    def pulse_schedule(self,name,start,period,width,count,**kwargs):
+        ''' Creates a schedule of periodic pulses for set_control_schedule.
+
+        Parameters
+        ----------
+        name : str
+            Name of the signal
+        start : int
+            Start time of the first pulse in simulation units
+        period : int
+            Period of the pulses
+        width : int
+            Width of the pulses
+        count : int
+            Number of pulses
+        active : int
+            Value of the signal during the pulse. Default 1
+
+        Returns
+        -------
+        (time, name, val) : tuple of ndarrays
+
+        '''
+        active=kwargs.get('active',1)
+        starts=start+np.arange(count,dtype=np.int64)*period
+        time=np.stack((starts,starts+width),axis=1).ravel()
+        val=np.tile([active,1-active],count)
+        return time, np.full(len(time),name,dtype=object), val
+
     def start_datafeed(self):
         f=self.iofile_bundle.Members['control_write']
         for name in [ 'initdone', ]:
@@ -0,0 +1,144 @@
+"""
+==============
+Core scheduler
+==============
+
+Shares the cores of the machine between concurrently running simulations.
+
+Reservations are recorded in a registry file shared by all processes of
+the user, guarded with an exclusive file lock. A simulation asks for a
+number of threads, and is granted at most its fair share of the cores:
+the cores not reserved by others, divided among the running
+simulations. Reservations of processes that have exited are dropped, so
+a crashed simulation does not hold its cores.
+
+"""
+
+import os
+import sys
+import json
+import fcntl
+import tempfile
+import contextlib
+if not (os.path.abspath('../../thesdk') in sys.path):
+    sys.path.append(os.path.abspath('../../thesdk'))
+
+from thesdk import *
+
+def available_cores():
+    ''' Number of cores this process may run on.
+
+    '''
+    if hasattr(os,'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+class core_scheduler(thesdk):
+    def _classfile(self):
+        return os.path.dirname(os.path.realpath(__file__)) + "/"+__name__
+
+    def __init__(self,*arg,**kwargs):
+        """ Core scheduler parameters and attributes
+            Parameters
+            ----------
+                *arg :
+                If any arguments are defined, the first one should be the parent instance
+
+                path : str
+                    Registry file of the reservations. Default: inverter_cores_<uid>.json
+                    in the temporary directory
+
+                ncores : int
+                    Number of cores shared. Default: cores available to the process
+
+        """
+        if len(arg)>=1:
+            self.parent=arg[0]
+        self.path=kwargs.get('path',os.path.join(tempfile.gettempdir(),
+            'inverter_cores_%d.json' %(os.getuid())))
+        self.ncores=kwargs.get('ncores',available_cores())
+        self._count=0
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with open(self.path+'.lock','a') as lock:
+            fcntl.flock(lock,fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.path) as f:
+                        registry=json.load(f)
+                except (OSError, ValueError):
+                    registry={}
+                # Reservations of exited processes are dropped
+                registry=dict([ (token, n) for token, n in registry.items()
+                    if self._alive(int(token.split(':')[0])) ])
+                yield registry
+                tmp=self.path+'.%d' %(os.getpid())
+                with open(tmp,'w') as f:
+                    json.dump(registry,f)
+                os.replace(tmp,self.path)
+            finally:
+                fcntl.flock(lock,fcntl.LOCK_UN)
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid,0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def acquire(self,want,exact=False):
+        ''' Reserves cores for a simulation.
+
+        Parameters
+        ----------
+        want : int
+            Number of threads the simulation could use.
+        exact : bool
+            If True, want threads are reserved regardless of the fair share, 
+            for simulations whose number of threads is fixed. Default False.
+
+        Returns
+        -------
+        (token, nproc) : tuple
+            Token of the reservation for release() and the number of granted
+            threads, at least 1.
+
+        '''
+        self._count+=1
+        token='%d:%d:%d' %(os.getpid(),id(self),self._count)
+        with self._locked() as registry:
+            free=self.ncores-sum(registry.values())
+            share=self.ncores//(len(registry)+1)
+            nproc=max(1,want if exact else min(want,free,share))
+            registry[token]=nproc
+        return token, nproc
+
+    def release(self,token):
+        ''' Releases the reservation of token.
+
+        '''
+        with self._locked() as registry:
+            registry.pop(token,None)
+
+    @contextlib.contextmanager
+    def reserve(self,want,exact=False):
+        ''' Context manager for a reservation, yields the number of granted threads.
+        See acquire.
+
+        '''
+        token, nproc=self.acquire(want,exact)
+        try:
+            yield nproc
+        finally:
+            self.release(token)
+
+    def reserved(self):
+        ''' Total number of cores reserved by running simulations.
+
+        '''
+        with self._locked() as registry:
+            return sum(registry.values())
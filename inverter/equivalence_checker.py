@@ -0,0 +1,295 @@
+"""
+===================
+Equivalence checker
+===================
+
+Sample-accurate comparison of the outputs of two simulation models.
+
+The output of the model under test may be delayed with respect to the
+reference by a latency of a few samples. Unless given, the latency is
+estimated by cross-correlating the output vectors over a window at
+the start of the data, computed with FFT. The aligned vectors are then
+compared without per-sample Python loops, and the indices of the first
+mismatches are reported.
+
+Long runs can be compared in chunks with feed() and result(), holding
+only a chunk of both streams in memory at a time.
+
+"""
+
+import os
+import sys
+if not (os.path.abspath('../../thesdk') in sys.path):
+    sys.path.append(os.path.abspath('../../thesdk'))
+
+from thesdk import *
+
+import numpy as np
+
+def estimate_latency(ref,dut,maxlatency=16):
+    ''' Estimates the latency of dut with respect to ref by cross-correlation.
+
+    Parameters
+    ----------
+    ref : ndarray
+        Reference samples of shape (samples,) or (samples, lanes)
+    dut : ndarray
+        Samples of the model under test, shape as ref
+    maxlatency : int
+        Maximum absolute latency searched
+
+    Returns
+    -------
+    int
+        Latency k maximizing the correlation of ref[n] and dut[n+k]. Negative
+        if dut leads. Of equal maxima, e.g. of periodic data, the latency of
+        the smallest magnitude is returned. 0 if either of the vectors is empty 
+        or constant.
+
+    '''
+    if len(ref) == 0 or len(dut) == 0:
+        return 0
+    x=np.asarray(ref,dtype=float).reshape(len(ref),-1)
+    y=np.asarray(dut,dtype=float).reshape(len(dut),-1)
+    lanes=min(x.shape[1],y.shape[1])
+    x=x[:,:lanes]-x[:,:lanes].mean(axis=0)
+    y=y[:,:lanes]-y[:,:lanes].mean(axis=0)
+    if not (x.any() and y.any()):
+        return 0
+    nfft=1<<int(len(x)+len(y)-1).bit_length()
+    corr=np.fft.irfft((np.conj(np.fft.rfft(x,nfft,axis=0))*np.fft.rfft(y,nfft,axis=0)).sum(axis=1),nfft)
+    # Lags -maxlatency...maxlatency, negative lags are wrapped to the end
+    maxlatency=min(maxlatency,len(x)-1,len(y)-1)
+    lags=np.arange(-maxlatency,maxlatency+1)
+    # Correlation is normalized by the number of overlapping samples
+    overlap=np.minimum(len(x),len(y)-lags)-np.maximum(0,-lags)
+    score=corr[lags%nfft]/np.maximum(overlap,1)
+    # Maxima equal within the rounding of the FFT are tied
+    tied=score >= score.max()-1e-9*np.abs(score).max()
+    return int(lags[tied][np.argmin(np.abs(lags[tied]))])
+
+class equivalence_checker(thesdk):
+    def _classfile(self):
+        return os.path.dirname(os.path.realpath(__file__)) + "/"+__name__
+
+    def __init__(self,*arg):
+        """ Equivalence checker parameters and attributes
+            Parameters
+            ----------
+                *arg :
+                If any arguments are defined, the first one should be the parent instance
+
+            Attributes
+            ----------
+            IOS : Bundle
+                Members 'ref' and 'dut' are the compared outputs, of shape (samples, lanes).
+
+            latency : int
+                Latency of 'dut' with respect to 'ref' in samples. If None, it is estimated
+                from the data. Default None
+
+            maxlatency : int
+                Maximum absolute latency searched in estimation. Default 16
+
+            window : int
+                Number of samples the latency is estimated from. Default 2**16
+
+            skip : int
+                Number of leading reference samples excluded from the comparison,
+                e.g. samples preceding the reset of rtl models. Default 0
+
+            nreport : int
+                Number of first mismatches reported. Default 10
+
+            chunksize : int
+                Number of samples compared at a time by run. Default 2**22
+
+            mismatches : ndarray
+                Reference sample indices of the first nreport mismatches. Set by run.
+
+            nmismatch : int
+                Total number of mismatching samples. Set by run.
+
+            ncompared : int
+                Number of compared samples. Set by run.
+
+            nunmatched : int
+                Number of samples of either stream without a counterpart in the other
+                after alignment, e.g. of a truncated output. Up to |latency| samples
+                are expected at the end. Set by run.
+
+        """
+        self.proplist = ['Rs'] # Properties that can be propagated from parent
+        self.Rs = 100e6
+        self.IOS.Members['ref'] = IO()
+        self.IOS.Members['dut'] = IO()
+        self.latency = None
+        self.maxlatency = 16
+        self.window = 2**16
+        self.skip = 0
+        self.nreport = 10
+        self.chunksize = 2**22
+        self.model = 'py'
+
+        if len(arg)>=1:
+            parent=arg[0]
+            self.copy_propval(parent,self.proplist)
+            self.parent=parent
+        self.init()
+
+    def init(self):
+        """ Method to re-initialize the structure if the attribute values are changed after creation.
+        Resets the state of the streaming comparison.
+
+        """
+        self._latency=self.latency
+        self._ref=None
+        self._dut=None
+        self._refpos=0 # Reference index of the first sample in self._ref
+        self._dutdrop=0 # Leading dut samples still to be dropped
+        self._refdrop=0 # Leading reference samples still to be dropped
+        self.mismatches=np.zeros(0,dtype=np.int64)
+        self.nmismatch=0
+        self.ncompared=0
+        self.nunmatched=0
+        if self._latency is not None:
+            self._align()
+
+    @property
+    def passed(self):
+        ''' True if samples were compared, no mismatches found and the streams
+        are of equal length up to the latency.
+
+        '''
+        return (self.ncompared > 0 and self.nmismatch == 0 
+                and self.nunmatched <= abs(self._latency or 0))
+
+    def feed(self,ref,dut):
+        ''' Compares the next chunks of the reference and dut streams.
+
+        The chunks may be of different lengths. Samples without a counterpart
+        are held until the next call.
+
+        '''
+        ref=np.asarray(ref)
+        dut=np.asarray(dut)
+        ref=ref[:,None] if ref.ndim==1 else ref
+        dut=dut[:,None] if dut.ndim==1 else dut
+        self._ref=ref if self._ref is None else np.concatenate((self._ref,ref))
+        self._dut=dut if self._dut is None else np.concatenate((self._dut,dut))
+        if self._latency is None:
+            if min(len(self._ref),len(self._dut)) < self.window+self.maxlatency:
+                return
+            self._estimate()
+        self._compare()
+
+    def result(self):
+        ''' Compares the held samples and returns the number of mismatches.
+
+        '''
+        if self._ref is not None and self._latency is None:
+            self._estimate()
+        if self._ref is not None:
+            self._compare()
+            # Samples left over after the alignment have no counterpart
+            self.nunmatched=len(self._ref)+len(self._dut)
+        if self.nmismatch:
+            self.print_log(type='W', msg='%d of %d samples mismatch with latency %d, first at %s'
+                    %(self.nmismatch,self.ncompared,self._latency,self.mismatches.tolist()))
+        if self.nunmatched > abs(self._latency or 0):
+            self.print_log(type='W', msg='%d samples without counterpart with latency %d'
+                    %(self.nunmatched,self._latency))
+        return self.nmismatch
+
+    def _estimate(self):
+        start=self.skip
+        self._latency=estimate_latency(self._ref[start:start+self.window],
+                self._dut[start:start+self.window+self.maxlatency],self.maxlatency)
+        self.print_log(type='I', msg='Estimated latency %d' %(self._latency))
+        self._align()
+
+    def _align(self):
+        if self._latency > 0:
+            self._dutdrop=self._latency
+        elif self._latency < 0:
+            # dut leads, the reference is dropped instead
+            self._refdrop=-self._latency
+
+    def _compare(self):
+        if self._dutdrop:
+            drop=min(self._dutdrop,len(self._dut))
+            self._dut=self._dut[drop:]
+            self._dutdrop-=drop
+        if self._refdrop:
+            drop=min(self._refdrop,len(self._ref))
+            self._ref=self._ref[drop:]
+            self._refdrop-=drop
+            self._refpos+=drop
+        if self._dutdrop or self._refdrop:
+            return
+        n=min(len(self._ref),len(self._dut))
+        lanes=min(self._ref.shape[1],self._dut.shape[1])
+        first=max(0,min(self.skip-self._refpos,n))
+        bad=np.flatnonzero((self._ref[first:n,:lanes]!=self._dut[first:n,:lanes]).any(axis=1))
+        if len(bad):
+            room=self.nreport-len(self.mismatches)
+            if room > 0:
+                self.mismatches=np.concatenate((self.mismatches,bad[:room]+first+self._refpos))
+            self.nmismatch+=len(bad)
+        self.ncompared+=n-first
+        self._ref=self._ref[n:]
+        self._dut=self._dut[n:]
+        self._refpos+=n
+
+    def main(self):
+        ''' Compares the data of IOS.Members 'ref' and 'dut' in full, in chunks
+        of self.chunksize samples to bound the size of the temporaries. 
+        Missing data is compared as an empty stream.
+
+        '''
+        self.init()
+        ref=self.IOS.Members['ref'].Data
+        dut=self.IOS.Members['dut'].Data
+        for name, data in [('ref', ref), ('dut', dut)]:
+            if data is None or len(data) == 0:
+                self.print_log(type='W', msg='No data in %s' %(name))
+        ref=np.zeros((0,1)) if ref is None else ref
+        dut=np.zeros((0,1)) if dut is None else dut
+        for start in range(0,max(len(ref),len(dut)),self.chunksize):
+            self.feed(ref[start:start+self.chunksize],dut[start:start+self.chunksize])
+        self.result()
+
+    def run(self,*arg):
+        if len(arg)>0:
+            self.par=True      #flag for parallel processing
+            self.queue=arg[0]  #multiprocessing.queue as the first argument
+        if self.model=='py':
+            self.main()
+        else:
+            self.print_log(type='E', msg='Model %s not supported' %(self.model))
+        if self.par:
+            self.queue.put({ 'nmismatch' : self.nmismatch, 'mismatches' : self.mismatches,
+                'ncompared' : self.ncompared, 'nunmatched' : self.nunmatched, 
+                'latency' : self._latency })
+
+if __name__=="__main__":
+    from inverter.equivalence_checker import equivalence_checker
+    ref=np.random.default_rng(0).integers(0,2,size=(2**20,1))
+    dut=np.concatenate((np.zeros((1,1),dtype=ref.dtype),ref))
+    dut[1000]^=1
+    c=equivalence_checker()
+    c.chunksize=2**16
+    c.IOS.Members['ref'].Data=ref
+    c.IOS.Members['dut'].Data=dut
+    c.run()
+    if c._latency != 1 or c.mismatches.tolist() != [999]:
+        sys.exit(1)
+    # Missing output fails the check
+    for data in [None, np.zeros((0,1),dtype=ref.dtype)]:
+        c=equivalence_checker()
+        c.IOS.Members['ref'].Data=ref
+        c.IOS.Members['dut'].Data=data
+        c.run()
+        if c.passed or c.nunmatched != len(ref):
+            sys.exit(1)
+    sys.exit(0)
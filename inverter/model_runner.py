@@ -0,0 +1,141 @@
+"""
+============
+Model runner
+============
+
+Runs the simulation models of several entities concurrently, one process
+per entity, using the parallel processing protocol of the entities: the
+queue given as the first argument of run() receives the IOS.Members of
+the entity once the simulation is done.
+
+Wall-clock time of a cross-model regression is then defined by the
+slowest simulator instead of the sum of all of them.
+"""
+
+import os
+import sys
+import time
+import queue
+import multiprocessing
+if not (os.path.abspath('../../thesdk') in sys.path):
+    sys.path.append(os.path.abspath('../../thesdk'))
+
+from thesdk import *
+
+class model_runner(thesdk):
+    def _classfile(self):
+        return os.path.dirname(os.path.realpath(__file__)) + "/"+__name__
+
+    def __init__(self,*arg): 
+        """ Model runner parameters and attributes
+            Parameters
+            ----------
+                *arg : 
+                If any arguments are defined, the first one should be the parent instance
+
+            Attributes
+            ----------
+            duts : list
+                Entities to be run. Their run method must accept a multiprocessing.Queue
+                as the first argument.
+
+            nworkers : int
+                Maximum number of concurrently running processes. Default: number of cores.
+
+            timeout : float or dict
+                Timeout of a single run in seconds. A dict maps model names to
+                timeouts, models not in the dict have no timeout. None for no timeout.
+                Default None
+
+            collect : list
+                Names of the IOS members collected from the runs. Data of these 
+                members is copied to the IOS of the entities in this process. 
+
+            failed : list
+                Entities that timed out or exited without results. Set by run.
+
+        """
+        self.proplist = [] # Properties that can be propagated from parent
+        self.duts = []
+        self.nworkers = os.cpu_count() or 1
+        self.timeout = None
+        self.collect = ['Z', 'A_OUT', 'A_DIG', 'Z_ANA', 'Z_RISE', 'POWER']
+        self.pollinterval = 0.1 # Seconds between queue polls
+        self.failed = []
+        self.model = 'py'
+
+        if len(arg)>=1:
+            parent=arg[0]
+            self.copy_propval(parent,self.proplist)
+            self.parent=parent
+
+    def init(self):
+        """ Method to re-initialize the structure if the attribute values are changed after creation.
+
+        """
+        pass #Currently nothing to add
+
+    def timeout_of(self,dut):
+        ''' Returns the timeout of the given entity in seconds, or None.
+
+        '''
+        if isinstance(self.timeout,dict):
+            return self.timeout.get(dut.model,None)
+        return self.timeout
+
+    def main(self):
+        ''' Runs the entities in at most self.nworkers concurrent processes and 
+        collects the results.
+
+        '''
+        # Fork keeps the entities as they are, nothing needs to be pickled on start
+        if 'fork' in multiprocessing.get_all_start_methods():
+            ctx=multiprocessing.get_context('fork')
+        else:
+            ctx=multiprocessing.get_context()
+        self.failed=[]
+        pending=list(range(len(self.duts)))
+        active={}
+        while pending or active:
+            while pending and len(active) < max(1,self.nworkers):
+                index=pending.pop(0)
+                dut=self.duts[index]
+                que=ctx.Queue()
+                proc=ctx.Process(target=dut.run,args=(que,))
+                proc.start()
+                timeout=self.timeout_of(dut)
+                deadline=time.time()+timeout if timeout is not None else None
+                active[index]=(proc,que,deadline)
+                self.print_log(type='I', msg='Started model %s in process %s' %(dut.model,proc.pid))
+            for index in list(active):
+                proc,que,deadline=active[index]
+                dut=self.duts[index]
+                try:
+                    # The results must be read before joining,
+                    # the process can not exit before the queue is flushed
+                    ret=que.get(timeout=self.pollinterval/max(1,len(active)))
+                except queue.Empty:
+                    if deadline is not None and time.time() > deadline:
+                        self.print_log(type='E', msg='Model %s timed out' %(dut.model))
+                        proc.terminate()
+                    elif proc.is_alive() or not que.empty():
+                        continue
+                    else:
+                        self.print_log(type='E', msg='Model %s exited with code %s without results' 
+                                %(dut.model,proc.exitcode))
+                    proc.join()
+                    self.failed.append(dut)
+                    del active[index]
+                    continue
+                for name in self.collect:
+                    if name in ret and name in dut.IOS.Members:
+                        dut.IOS.Members[name].Data=ret[name].Data
+                proc.join()
+                del active[index]
+                self.print_log(type='I', msg='Model %s done' %(dut.model))
+
+    def run(self,*arg):
+        if self.model=='py':
+            self.main()
+        else:
+            self.print_log(type='E', msg='Model %s not supported' %(self.model))
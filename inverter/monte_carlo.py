@@ -0,0 +1,374 @@
+"""
+===========
+Monte Carlo
+===========
+
+Monte Carlo runs of the inverter over random supply voltage, sample rate,
+temperature and corner.
+
+The parameter samples are drawn with a seeded generator, so a run is
+reproducible. The samples are divided into shards that are simulated in
+a pool of processes, a shard at a time per process. Statistics of every
+sample are folded into running accumulators instead of keeping the
+waveforms. Every completed shard is written as a JSON checkpoint, an
+interrupted run resumes from the shards not yet completed.
+
+Example::
+
+    d=inverter()
+    d.model='ngspice'
+    d.IOS.Members['A']=s_source.IOS.Members['data']
+    d.IOS.Members['CLK']=s_source.IOS.Members['clk']
+    mc=monte_carlo(d)
+    mc.nsamples=200
+    mc.distributions={ 'vdd' : ('normal', 1.0, 0.05), 'temp' : ('uniform', -40, 125) }
+    mc.run()
+    mc.stats['delay'].mean
+
+"""
+
+import os
+import sys
+import json
+import hashlib
+import multiprocessing
+if not (os.path.abspath('../../thesdk') in sys.path):
+    sys.path.append(os.path.abspath('../../thesdk'))
+
+from thesdk import *
+
+import numpy as np
+
+class running_stats:
+    ''' Running count, mean, variance, minimum and maximum of a quantity.
+    Batches of values are added and accumulators merged with the pairwise
+    update of Chan et al.
+
+    '''
+    def __init__(self,count=0,mean=0.0,m2=0.0,min=np.inf,max=-np.inf):
+        self.count=count
+        self.mean=mean
+        self.m2=m2
+        self.min=min
+        self.max=max
+
+    def update(self,values):
+        ''' Adds a batch of values.
+
+        '''
+        values=np.asarray(values,dtype=float).ravel()
+        values=values[np.isfinite(values)]
+        if len(values):
+            mean=values.mean()
+            self.merge(running_stats(len(values),mean,((values-mean)**2).sum(),values.min(),values.max()))
+
+    def merge(self,other):
+        ''' Adds the values accumulated by other.
+
+        '''
+        if other.count == 0:
+            return
+        count=self.count+other.count
+        delta=other.mean-self.mean
+        self.mean+=delta*other.count/count
+        self.m2+=other.m2+delta**2*self.count*other.count/count
+        self.count=count
+        self.min=min(self.min,other.min)
+        self.max=max(self.max,other.max)
+
+    @property
+    def var(self):
+        return self.m2/(self.count-1) if self.count > 1 else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def to_dict(self):
+        return { 'count' : int(self.count), 'mean' : float(self.mean), 'm2' : float(self.m2),
+                'min' : float(self.min), 'max' : float(self.max) }
+
+    @classmethod
+    def from_dict(cls,values):
+        return cls(**values)
+
+def delay(dut):
+    ''' Propagation delays [s] from the falling edges of the input to the
+    rising edges of the output, from the waveforms A_OUT and Z_ANA.
+
+    '''
+    from inverter.waveform_stream import edge_engine
+    a=dut.IOS.Members['A_OUT'].Data
+    z=dut.IOS.Members['Z_ANA'].Data
+    if not isinstance(a,np.ndarray) or not isinstance(z,np.ndarray):
+        return np.empty(0)
+    vth=dut.vdd/2
+    afall=edge_engine()
+    afall.crossing('fall','A',vth,edgetype='falling')
+    afall.feed({ 'A' : a })
+    zrise=edge_engine()
+    zrise.crossing('rise','Z',vth,edgetype='rising')
+    zrise.feed({ 'Z' : z })
+    afall=afall.result()['fall'][:,0]
+    zrise=zrise.result()['rise'][:,0]
+    # Every rising output edge is paired with the latest preceding falling input edge
+    index=np.searchsorted(afall,zrise,side='right')-1
+    valid=index >= 0
+    return zrise[valid]-afall[index[valid]]
+
+def rise_phase(dut):
+    ''' Times [s] of the rising edges Z_RISE relative to the start of their sample period.
+
+    '''
+    rise=dut.IOS.Members['Z_RISE'].Data
+    if not isinstance(rise,np.ndarray):
+        return np.empty(0)
+    return np.mod(rise[:,0],1/dut.Rs)
+
+class monte_carlo(thesdk):
+    def _classfile(self):
+        return os.path.dirname(os.path.realpath(__file__)) + "/"+__name__
+
+    def __init__(self,*arg):
+        """ Monte Carlo parameters and attributes
+            Parameters
+            ----------
+                *arg :
+                If any arguments are defined, the first one should be the inverter
+                instance to be simulated
+
+            Attributes
+            ----------
+            nsamples : int
+                Number of Monte Carlo samples. Default 100
+
+            seed : int
+                Seed of the parameter samples. Default 0
+
+            distributions : dict
+                Distributions of the varied parameters 'vdd', 'Rs', 'temp' and 'corner', as
+                tuples ('normal', mean, std), ('uniform', low, high) or ('choice', [values]).
+                Default { 'vdd' : ('normal', 1.0, 0.05) }
+
+            shardsize : int
+                Number of samples per shard. Default 16
+
+            nworkers : int
+                Maximum number of concurrently simulated shards. Default: number of cores
+
+            timeout : float
+                Timeout in seconds for the next shard to complete, or None for no
+                timeout. Shards not completed are left for a resumed run. Default 3600
+
+            checkpointdir : str
+                Directory of the shard checkpoints. Default: montecarlo directory of the
+                entity of the simulated inverter
+
+            statistics : dict
+                Functions computing the values of a statistic from a simulated inverter, by
+                name. Default { 'delay' : delay, 'rise_phase' : rise_phase }
+
+            samples : dict
+                Parameter values of the samples by parameter. Set by run.
+
+            stats : dict
+                Running statistics by name, see running_stats. Set by run.
+
+            failed : int
+                Number of samples whose simulation failed. Set by run.
+
+            failedshards : list
+                Shards whose simulation failed or timed out, not checkpointed. Set by run.
+
+        """
+        self.proplist = [] # Properties that can be propagated from parent
+        self.dut = None
+        self.nsamples = 100
+        self.seed = 0
+        self.distributions = { 'vdd' : ('normal', 1.0, 0.05) }
+        self.shardsize = 16
+        self.nworkers = os.cpu_count() or 1
+        self.timeout = 3600
+        self.checkpointdir = None
+        self.statistics = { 'delay' : delay, 'rise_phase' : rise_phase }
+        self.samples = {}
+        self.stats = {}
+        self.failed = 0
+        self.failedshards = []
+        self.model = 'py'
+
+        if len(arg)>=1:
+            parent=arg[0]
+            self.copy_propval(parent,self.proplist)
+            self.parent=parent
+            self.dut=parent
+
+    def init(self):
+        """ Method to re-initialize the structure if the attribute values are changed after creation.
+
+        """
+        pass #Currently nothing to add
+
+    def draw(self):
+        ''' Draws the parameter samples.
+
+        Returns
+        -------
+        dict
+            Arrays of self.nsamples values by parameter
+
+        '''
+        rng=np.random.default_rng(self.seed)
+        samples={}
+        # Parameters are drawn in a fixed order, independent of the order of the dict
+        for name in sorted(self.distributions):
+            if name not in ['vdd', 'Rs', 'temp', 'corner']:
+                self.print_log(type='F', msg='Variation of %s not supported' %(name))
+            kind, *args=self.distributions[name]
+            if kind == 'normal':
+                samples[name]=rng.normal(args[0],args[1],self.nsamples)
+            elif kind == 'uniform':
+                samples[name]=rng.uniform(args[0],args[1],self.nsamples)
+            elif kind == 'choice':
+                samples[name]=np.asarray(args[0],dtype=object)[rng.integers(0,len(args[0]),self.nsamples)]
+            else:
+                self.print_log(type='F', msg='Distribution %s not supported' %(kind))
+        return samples
+
+    def config_key(self):
+        ''' Hash of the configuration, checkpoints of other configurations are not resumed.
+        The stimulus, the base parameters and the sources of the simulated inverter
+        are covered by its simulation cache key.
+
+        '''
+        config=repr((self.dut.cache_key(), self.nsamples, self.seed, sorted(self.distributions.items()),
+            self.shardsize, sorted(self.statistics)))
+        return hashlib.sha256(config.encode()).hexdigest()[:16]
+
+    @property
+    def checkpointpath(self):
+        path=self.checkpointdir or os.path.join(self.dut.entitypath,'montecarlo')
+        return os.path.join(path,self.config_key())
+
+    def checkpoint_file(self,shard):
+        return os.path.join(self.checkpointpath,'shard_%05d.json' %(shard))
+
+    def load_checkpoint(self,shard):
+        ''' Returns the checkpoint of a completed shard, or None.
+
+        '''
+        try:
+            with open(self.checkpoint_file(shard)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store_checkpoint(self,shard,result):
+        ''' Writes the checkpoint of a completed shard atomically.
+
+        '''
+        os.makedirs(self.checkpointpath,exist_ok=True)
+        file=self.checkpoint_file(shard)
+        with open(file+'.tmp','w') as f:
+            json.dump(result,f)
+        os.replace(file+'.tmp',file)
+
+    def simulate_shard(self,shard):
+        ''' Simulates the samples of a shard sequentially.
+
+        Returns
+        -------
+        dict
+            Accumulated statistics of the shard and the number of failed samples.
+
+        '''
+        stats=dict([ (name, running_stats()) for name in self.statistics ])
+        failed=0
+        for index in range(shard*self.shardsize,min((shard+1)*self.shardsize,self.nsamples)):
+            d=self.dut.copy_for_sweep()
+            for name, values in self.samples.items():
+                if name in ['vdd', 'Rs']:
+                    setattr(d,name,float(values[index]))
+                else:
+                    d.spicecorner[name]=values[index]
+            try:
+                d.run()
+                for name, statistic in self.statistics.items():
+                    stats[name].update(statistic(d))
+            except (Exception, SystemExit) as e:
+                # Fatal errors of the simulation exit with SystemExit
+                self.print_log(type='E', msg='Sample %d failed: %s' %(index,e))
+                failed+=1
+        return { 'shard' : shard, 'failed' : failed,
+                'stats' : dict([ (name, s.to_dict()) for name, s in stats.items() ]) }
+
+    def main(self):
+        ''' Runs the shards not completed earlier in a pool of processes and
+        merges their statistics.
+
+        '''
+        if self.dut is None:
+            self.print_log(type='F', msg='No inverter to simulate')
+        self.samples=self.draw()
+        nshards=-(-self.nsamples//self.shardsize)
+        results=[]
+        pending=[]
+        self.failedshards=[]
+        for shard in range(nshards):
+            result=self.load_checkpoint(shard)
+            if result is None:
+                pending.append(shard)
+            else:
+                results.append(result)
+        if results:
+            self.print_log(type='I', msg='Resuming with %d of %d shards done' %(len(results),nshards))
+        if pending:
+            global _manager
+            _manager=self
+            if 'fork' in multiprocessing.get_all_start_methods():
+                ctx=multiprocessing.get_context('fork')
+            else:
+                ctx=multiprocessing.get_context()
+            try:
+                with ctx.Pool(processes=max(1,min(len(pending),self.nworkers))) as pool:
+                    # Shards are checkpointed as they complete
+                    completed=pool.imap_unordered(_simulate_shard,pending)
+                    for i in range(len(pending)):
+                        try:
+                            result=completed.next(timeout=self.timeout)
+                        except multiprocessing.TimeoutError:
+                            self.print_log(type='E', msg='No shard completed in %s s' %(self.timeout))
+                            self.failedshards+=sorted(set(pending)-set([ r['shard'] for r in results ])
+                                    -set(self.failedshards))
+                            break
+                        if 'error' in result:
+                            self.print_log(type='E', msg='Shard %d failed: %s' %(result['shard'],result['error']))
+                            self.failedshards.append(result['shard'])
+                            continue
+                        self.store_checkpoint(result['shard'],result)
+                        results.append(result)
+                        self.print_log(type='I', msg='Shard %d of %d done' %(len(results),nshards))
+            finally:
+                _manager=None
+        self.stats=dict([ (name, running_stats()) for name in self.statistics ])
+        self.failed=0
+        for result in sorted(results,key=lambda result: result['shard']):
+            self.failed+=result['failed']
+            for name in self.stats:
+                self.stats[name].merge(running_stats.from_dict(result['stats'][name]))
+
+    def run(self,*arg):
+        if self.model=='py':
+            self.main()
+        else:
+            self.print_log(type='E', msg='Model %s not supported' %(self.model))
+
+_manager=None
+
+def _simulate_shard(shard):
+    # A result is returned for every shard, an exception in the worker would
+    # lose the shard
+    try:
+        return _manager.simulate_shard(shard)
+    except BaseException as e:
+        return { 'shard' : shard, 'error' : repr(e) }
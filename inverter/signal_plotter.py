@@ -24,9 +24,9 @@ if not (os.path.abspath('../../thesdk') in sys.path):
 
 from thesdk import *
 
+import multiprocessing
 import numpy as np
-import matplotlib.pyplot as plt
-import pdb
+# Matplotlib is imported when a plot is made
 
 class signal_plotter(thesdk):
     def _classfile(self):
@@ -50,6 +50,7 @@ class signal_plotter(thesdk):
                 Default members defined as
 
                 self.IOS.Members['A'] = IO() 
+                self.IOS.Members['Z'] = IO() 
                 self.IOS.Members['A_OUT'] = IO() 
                 self.IOS.Members['A_DIG'] = IO() 
                 self.IOS.Members['Z_ANA'] = IO() 
@@ -60,11 +61,33 @@ class signal_plotter(thesdk):
 
         plotprefix : string
             Default  ''
-            Plotfiles are named as inv_<plotprefix><plotmodel>.eps
+            Plotfiles are named as inv_<plotprefix><plotmodel>.<plotformat>
+
+        plotformat : string
+            Format of the plot file, e.g. 'eps' or 'png'. Raster formats are 
+            fast to write regardless of the length of the traces. Default 'eps'
+
+        plotdpi : int
+            Resolution of the plot file. Default 300
+
+        plotwindow : bool
+            If True, analog traces are sliced to the plotted time window before 
+            plotting. If False, the full traces are plotted. Default True
+
+        headless : bool
+            If True, figures are rendered with the Agg backend without pyplot
+            and are not shown. Default False
+
+        envelope : bool
+            If True, analog traces with more points than the plot has pixels are 
+            decimated to their min/max envelope at the pixel width. Default True
 
         plotvdd : float
             Supply voltage of analog signals. Defines the range for plots
 
+        nsamp : int
+            Number of samples plotted. Default 20
+
 
         """
         #self.print_log(type='I', msg='Initializing %s' %(__name__)) 
@@ -72,6 +95,7 @@ class signal_plotter(thesdk):
         self.Rs = 100e6
 
         self.IOS.Members['A'] = IO() 
+        self.IOS.Members['Z'] = IO() 
         self.IOS.Members['A_OUT'] = IO() 
         self.IOS.Members['A_DIG'] = IO() 
         self.IOS.Members['Z_ANA'] = IO() 
@@ -80,6 +104,13 @@ class signal_plotter(thesdk):
         self.plotmodel = 'py'
         self.plotprefix = ''
         self.plotvdd = 1.0
+        self.nsamp = 20
+        self.plotformat = 'eps'
+        self.plotdpi = 300
+        self.plotwindow = True
+        self.envelope = True
+        self.headless = False
+        self.plotfile = None # Name of the latest plot file
 
         # this copies the parameter values from the parent based on self.proplist
         if len(arg)>=1:
@@ -99,10 +130,10 @@ class signal_plotter(thesdk):
         ''' Creates the plots 
         '''
         hfont = {'fontname':'Sans'}
-        nsamp = 20
+        nsamp = self.nsamp
         x = np.arange(nsamp).reshape(-1,1)
         if self.plotmodel == 'eldo' or self.plotmodel=='spectre' or self.plotmodel=='ngspice':
-            figure,axes = plt.subplots(2,2,sharex='col',tight_layout=True)
+            figure,axes = self.subplots(2,2,sharex='col',tight_layout=True)
             axes[0,0].stem(x,self.IOS.Members['A_DIG'].Data[:nsamp,0])
             axes[0,0].set_ylabel('Input', **hfont,fontsize=18)
             axes[0,0].grid(True)
@@ -111,20 +142,28 @@ class signal_plotter(thesdk):
             axes[1,0].set_ylabel('Output', **hfont,fontsize=18)
             axes[1,0].set_xlabel('Sample', **hfont,fontsize=18)
             axes[1,0].grid(True)
-            axes[0,1].plot(self.IOS.Members['A_OUT'].Data[:,0],self.IOS.Members['A_OUT'].Data[:,1],label='Input')
+            tlim=(0,(nsamp-1)/self.Rs)
+            npix=int(figure.get_size_inches()[0]*self.plotdpi/2) # Pixels per column
+            t,v=self.trace(self.IOS.Members['A_OUT'].Data,tlim,npix)
+            axes[0,1].plot(t,v,label='Input')
             axes[0,1].grid(True)
-            axes[1,1].plot(self.IOS.Members['Z_ANA'].Data[:,0],self.IOS.Members['Z_ANA'].Data[:,1],label='Output')
-            axes[1,1].plot(self.IOS.Members['Z_RISE'].Data[:,0],np.ones(self.IOS.Members['Z_RISE'].Data[:,0].shape)*self.plotvdd/2,\
+            t,v=self.trace(self.IOS.Members['Z_ANA'].Data,tlim,npix)
+            axes[1,1].plot(t,v,label='Output')
+            rise=self.IOS.Members['Z_RISE'].Data[:,0]
+            if self.plotwindow:
+                rise=rise[np.searchsorted(rise,tlim[0]):np.searchsorted(rise,tlim[1],side='right')]
+            axes[1,1].plot(rise,np.ones(rise.shape)*self.plotvdd/2,\
                            ls='None',marker='o',label='Rising edges')
             axes[1,1].set_xlabel('Time (s)', **hfont,fontsize=18)
-            axes[1,1].set_xlim(0,(nsamp-1)/self.Rs)
+            if self.plotwindow:
+                axes[1,1].set_xlim(*tlim)
             axes[1,1].grid(True)
         else:
             if self.plotmodel in [ 'placeholder' ]:
                 latency=1
             else:
                 latency=0
-            figure,axes=plt.subplots(2,1,sharex=True)
+            figure,axes=self.subplots(2,1,sharex=True)
             axes[0].stem(x,self.IOS.Members['A'].Data[:nsamp,0])
             axes[0].set_ylim(0, 1.1)
             axes[0].set_xlim((np.amin(x), np.amax(x)))
@@ -137,11 +176,94 @@ class signal_plotter(thesdk):
             axes[1].set_xlabel('Sample (n)', **hfont,fontsize=18)
             axes[1].grid(True)
         titlestr = "Inverter model %s" %(self.plotmodel) 
-        plt.suptitle(titlestr,fontsize=20)
-        plt.grid(True)
-        plt.show(block=False)
-        printstr="../inv_%s%s.eps" %(self.plotprefix,self.plotmodel)
-        figure.savefig(printstr, format='eps', dpi=300)
+        figure.suptitle(titlestr,fontsize=20)
+        if not self.headless:
+            import matplotlib.pyplot as plt
+            plt.show(block=False)
+        printstr="../inv_%s%s.%s" %(self.plotprefix,self.plotmodel,self.plotformat)
+        figure.savefig(printstr, format=self.plotformat, dpi=self.plotdpi)
+        if self.headless:
+            figure.clear()
+        self.plotfile=printstr
+
+    def subplots(self,nrows,ncols,**kwargs):
+        ''' Creates a figure and its axes. In headless mode the figure is created 
+        with the object-oriented API on an Agg canvas, and is not registered
+        to pyplot.
+
+        '''
+        if self.headless:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            figure=Figure(tight_layout=kwargs.pop('tight_layout',None))
+            FigureCanvasAgg(figure)
+            axes=figure.subplots(nrows,ncols,**kwargs)
+        else:
+            import matplotlib.pyplot as plt
+            figure,axes=plt.subplots(nrows,ncols,**kwargs)
+        return figure,axes
+
+    def trace(self,data,tlim,npix):
+        ''' Prepares an analog trace for plotting. The trace is sliced to the
+        time window tlim with a binary search on the time column if 
+        self.plotwindow is True, and decimated to its min/max envelope 
+        of npix bins if self.envelope is True.
+
+        Parameters
+        ----------
+        data : ndarray
+            Trace of shape (n,2) with columns time and value, time ascending.
+        tlim : tuple
+            Time window (tmin, tmax)
+        npix : int
+            Width of the plot in pixels
+
+        Returns
+        -------
+        t, v : ndarrays
+
+        '''
+        t=data[:,0]
+        v=data[:,1]
+        if self.plotwindow:
+            # Include the points just outside the window to draw the edges
+            start=max(0,np.searchsorted(t,tlim[0])-1)
+            stop=np.searchsorted(t,tlim[1],side='right')+1
+            t=t[start:stop]
+            v=v[start:stop]
+        if self.envelope and len(t) > 2*npix:
+            binsize=-(-len(t)//npix)
+            nbins=-(-len(t)//binsize)
+            # Last bin is padded with the last value
+            bins=np.concatenate((v,np.repeat(v[-1],nbins*binsize-len(v)))).reshape(nbins,binsize)
+            offset=np.arange(nbins)*binsize
+            # Minimum and maximum of every bin in the order of occurrence
+            idx=np.sort(np.stack((bins.argmin(axis=1)+offset,bins.argmax(axis=1)+offset),axis=1),axis=1).ravel()
+            idx=np.minimum(idx,len(t)-1)
+            t=t[idx]
+            v=v[idx]
+        return t,v
+
+    def stream(self,chunks):
+        ''' Consumes a stream of (A, Z) chunks, e.g. from inverter.stream(), 
+        and plots it. Only the samples needed for the plot are buffered,
+        the rest of the stream is drained without storing it.
+
+        '''
+        keep=self.nsamp+1 # Room for latency
+        heads={'A' : [], 'Z' : []}
+        buffered=0
+        for a, z in chunks:
+            if buffered < keep:
+                # Lanes are kept in the columns
+                a=np.asarray(a)
+                z=np.asarray(z)
+                heads['A'].append(a.reshape(len(a),-1)[:keep-buffered])
+                heads['Z'].append(z.reshape(len(z),-1)[:keep-buffered])
+                buffered+=len(heads['A'][-1])
+        for name, head in heads.items():
+            self.IOS.Members[name].Data=np.concatenate(head) if head else np.empty((0,1))
+        self.run()
 
     def run(self,*arg):
         if self.model=='py':
@@ -149,3 +271,43 @@ class signal_plotter(thesdk):
         else:
             self.print_log(type='E', msg='Model %s not supported' %(self.model))
 
+# Plotters of the ongoing batch, inherited by the forked workers
+_batch=[]
+
+def _render(index):
+    p=_batch[index]
+    p.headless=True
+    p.run()
+    return p.plotfile
+
+def plot_batch(plotters,nworkers=None):
+    ''' Renders the plots of the given plotters in headless mode, 
+    concurrently in a pool of processes, one plotter per task.
+
+    Parameters
+    ----------
+    plotters : list
+        signal_plotter instances
+    nworkers : int
+        Number of processes. Default: number of cores.
+
+    Returns
+    -------
+    list
+        Names of the written plot files
+
+    '''
+    global _batch
+    _batch=list(plotters)
+    if 'fork' in multiprocessing.get_all_start_methods():
+        ctx=multiprocessing.get_context('fork')
+    else:
+        ctx=multiprocessing.get_context()
+    try:
+        with ctx.Pool(processes=min(len(_batch),nworkers or os.cpu_count() or 1) or 1) as pool:
+            files=pool.map(_render,range(len(_batch)))
+    finally:
+        _batch=[]
+    for p, file in zip(plotters,files):
+        p.plotfile=file
+    return files
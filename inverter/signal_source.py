@@ -54,11 +54,51 @@ class signal_source(thesdk):
         length : int
             The length of the data. Default 2**8
 
+        chunksize : int
+            Number of data samples per chunk yielded by stream(). Default 2**16
+
+        clkos : int
+            Oversampling ratio of the clock, i.e. clock samples per data sample. Default 2
+
+        clkdiv : int
+            Clock period in data samples. Default 1
+
+        duty : float
+            Duty cycle of the clock. Default 0.5
+
+        phase : float
+            Phase of the clock as a fraction of the clock period. Default 0.0
+
+        nphases : int
+            Number of clock phases. If larger than 1, clock has one column per phase, 
+            the phases evenly spaced over the clock period. Default 1
+
+        rng : numpy.random.Generator
+            Random generator for the data, shared by the calls of main and stream. If None, 
+            a new one is created with numpy.random.default_rng(seed) for every call, so that 
+            main and stream give identical data for a given seed. Default None
+
+        seed : int
+            Seed for the random generator. The generator is local, the global random 
+            state of numpy is neither seeded nor used. Default None
+
+        dtype : numpy dtype
+            Data type of the data and clock outputs. Default int
+
 
         """
         #self.print_log(type='I', msg='Initializing %s' %(__name__)) 
         self.proplist = ['Rs'] # Properties that can be propagated from parent
         self.length=2**8 # Length of the data.
+        self.chunksize=2**16 # Chunk length for streaming
+        self.clkos=2 # Clock samples per data sample
+        self.clkdiv=1 # Clock period in data samples
+        self.duty=0.5
+        self.phase=0.0 # Fraction of clock period
+        self.nphases=1
+        self.rng=None # numpy.random.Generator for the data
+        self.seed=None
+        self.dtype=int
 
         self.IOS.Members['data'] = IO() # Pointer for clock output
         self.IOS.Members['clk'] = IO() # Pointer for clock output
@@ -78,14 +118,59 @@ class signal_source(thesdk):
         """
         pass #Currently nothing to add
 
+    def generator(self):
+        ''' Returns the random generator used for the data.
+
+        '''
+        if self.rng is None:
+            return np.random.default_rng(self.seed)
+        return self.rng
+
+    def draw(self,rng,nsamp):
+        ''' Draws nsamp random bits of self.dtype. The bits are drawn as 64-bit 
+        integers, so the sequence does not depend on the dtype or on the chunking.
+
+        '''
+        return rng.integers(2,size=nsamp,dtype=np.int64).astype(self.dtype,copy=False).reshape(-1,1)
+
+    def clock(self,start,stop):
+        ''' Generates the clock samples with indexes from start to stop.
+        The clock is low for the first (1-duty) fraction of the period and
+        high for the rest of it.
+
+        Returns
+        -------
+        ndarray
+            Clock of shape (stop-start, nphases)
+
+        '''
+        period=self.clkos*self.clkdiv
+        high=int(round(period*self.duty))
+        shifts=np.round((self.phase+np.arange(self.nphases)/self.nphases)*period).astype(np.int64)
+        n=np.arange(start,stop,dtype=np.int64).reshape(-1,1)
+        return (((n-shifts)%period) >= period-high).astype(self.dtype)
+
     def main(self):
         ''' Creates the signals and assigns them to output 
         '''
-        indata=np.random.randint(2,size=self.length).reshape(-1,1)
-        clk=np.array([0 if i%2==0 else 1 for i in range(2*len(indata))]).reshape(-1,1)
+        indata=self.draw(self.generator(),self.length)
+        clk=self.clock(0,self.clkos*self.length)
         self.IOS.Members['data'].Data = indata 
         self.IOS.Members['clk'].Data = clk 
 
+    def stream(self):
+        ''' Generator yielding the signals in chunks of self.chunksize 
+        data samples as (data, clk) tuples. Total length is self.length.
+        Only one chunk is kept in memory at a time.
+
+        '''
+        rng=self.generator()
+        for start in range(0,self.length,self.chunksize):
+            nsamp=min(self.chunksize,self.length-start)
+            indata=self.draw(rng,nsamp)
+            clk=self.clock(self.clkos*start,self.clkos*(start+nsamp))
+            yield indata, clk
+
     def run(self,*arg):
         if self.model=='py':
             self.main()
@@ -0,0 +1,133 @@
+"""
+=================
+Simulation cache
+=================
+
+Content-addressed on-disk cache for simulation results. 
+
+The key of a simulation is a hash over everything that defines its
+results: the input data, the model parameters and the contents of the
+source files of the entity. The cached values are the output IO data.
+The size of the cache is limited, least recently used entries are
+evicted first.
+
+"""
+
+import os
+import sys
+import hashlib
+import pickle
+import tempfile
+if not (os.path.abspath('../../thesdk') in sys.path):
+    sys.path.append(os.path.abspath('../../thesdk'))
+
+from thesdk import *
+
+import numpy as np
+
+class simcache(thesdk):
+    def _classfile(self):
+        return os.path.dirname(os.path.realpath(__file__)) + "/"+__name__
+
+    def __init__(self,*arg,**kwargs): 
+        """ Simulation cache parameters and attributes
+            Parameters
+            ----------
+                *arg : 
+                If any arguments are defined, the first one should be the parent instance
+
+                path : str
+                    Directory of the cache. Default: simcache directory of the entity
+
+                maxsize : int
+                    Maximum total size of the cache in bytes. Default 1 GiB
+
+        """
+        if len(arg)>=1:
+            self.parent=arg[0]
+            self.path=kwargs.get('path',os.path.join(self.parent.entitypath,'simcache'))
+        else:
+            self.path=kwargs.get('path',os.path.join(os.getcwd(),'simcache'))
+        self.maxsize=kwargs.get('maxsize',2**30)
+
+    def key(self,params,arrays={},files=[]):
+        ''' Computes the cache key.
+
+        Parameters
+        ----------
+        params : dict
+            Parameters defining the simulation. Values must have a deterministic repr.
+        arrays : dict
+            Input data arrays.
+        files : list
+            Source files whose contents define the simulation.
+
+        Returns
+        -------
+        str
+            Hex digest of the key
+
+        '''
+        h=hashlib.sha256()
+        h.update(repr(sorted(params.items())).encode())
+        for name in sorted(arrays):
+            data=np.ascontiguousarray(arrays[name])
+            h.update(('%s:%s:%s' %(name,data.dtype.str,data.shape)).encode())
+            h.update(memoryview(data).cast('B'))
+        for file in sorted(files):
+            h.update(file.encode())
+            with open(file,'rb') as f:
+                h.update(f.read())
+        return h.hexdigest()
+
+    def file(self,key):
+        return os.path.join(self.path,'%s.pickle' %(key))
+
+    def load(self,key):
+        ''' Returns the cached dict of output data for the key, or None.
+
+        '''
+        file=self.file(key)
+        try:
+            with open(file,'rb') as f:
+                data=pickle.load(f)
+        except (OSError,EOFError,pickle.UnpicklingError):
+            return None
+        # Modification time is used as the access time for eviction
+        os.utime(file)
+        return data
+
+    def store(self,key,data):
+        ''' Stores the dict of output data under the key and evicts the least 
+        recently used entries if the cache exceeds its size.
+
+        '''
+        os.makedirs(self.path,exist_ok=True)
+        # Write to a temporary file first to keep concurrent readers consistent
+        fd,tmp=tempfile.mkstemp(dir=self.path,suffix='.tmp')
+        with os.fdopen(fd,'wb') as f:
+            pickle.dump(data,f,protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp,self.file(key))
+        self.evict()
+
+    def evict(self):
+        ''' Removes the least recently used entries until the total size is 
+        within self.maxsize.
+
+        '''
+        entries=[]
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.name.endswith('.pickle'):
+                    stat=entry.stat()
+                    entries.append((stat.st_mtime,stat.st_size,entry.path))
+        total=sum([ size for _,size,_ in entries ])
+        for _,size,path in sorted(entries):
+            if total <= self.maxsize:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total-=size
+            self.print_log(type='I', msg='Evicted %s from simulation cache' %(os.path.basename(path)))
@@ -0,0 +1,72 @@
+"""
+============
+Sweep result
+============
+
+Labelled N-dimensional container for the results of a parameter sweep.
+The first dimensions of the data arrays are the swept parameters, in the 
+order they were given to the sweep. 
+
+"""
+
+import numpy as np
+
+class sweep_result:
+    def __init__(self,**kwargs):
+        """ Sweep result parameters and attributes
+            Parameters
+            ----------
+                dims : list
+                    Names of the swept parameters
+
+                coords : dict
+                    Values of the swept parameters
+
+                duts : ndarray
+                    Entities simulated at the grid points, of the shape of the grid
+
+                names : list
+                    Names of the collected IOS members
+
+            Attributes
+            ----------
+            data : dict
+                Collected data by IOS member name. If the data of all the points 
+                has the same shape, the value is an ndarray of shape grid shape + data shape. 
+                Otherwise it is an object array of the grid shape.
+
+        """
+        self.dims=kwargs.get('dims',[])
+        self.coords=kwargs.get('coords',{})
+        duts=kwargs.get('duts',np.empty((0,),dtype=object))
+        self.shape=duts.shape
+        self.data={}
+        for name in kwargs.get('names',[]):
+            values=np.empty(self.shape,dtype=object)
+            for index in np.ndindex(*self.shape):
+                values[index]=duts[index].IOS.Members[name].Data
+            self.data[name]=self._stack(values)
+
+    def _stack(self,values):
+        items=list(values.flat)
+        if (not items or any([ not isinstance(item,np.ndarray) for item in items ])
+                or len(set([ item.shape for item in items ])) != 1):
+            return values
+        return np.stack(items).reshape(self.shape+items[0].shape)
+
+    def sel(self,name,**coords):
+        ''' Selects the data of the named member at the given parameter values.
+        Parameters not given are returned in full.
+
+        Example
+        -------
+        result.sel('Z', vdd=1.0, temp=27)
+
+        '''
+        index=[]
+        for dim in self.dims:
+            if dim in coords:
+                index.append(self.coords[dim].index(coords[dim]))
+            else:
+                index.append(slice(None))
+        return self.data[name][tuple(index)]
@@ -0,0 +1,170 @@
+"""
+======
+Tracer
+======
+
+Span-style timing and counters for instrumenting the phases of a 
+simulation run.
+
+Spans are either opened and closed with begin and end, or used as 
+context managers with span. Nested spans are supported. Hooks are 
+called at the start and end of every span, to drive external 
+profilers. The records can be exported as JSON or in the Chrome trace 
+event format, viewable e.g. with chrome://tracing or Perfetto.
+
+Example::
+
+    t=tracer()
+    with t.span('simulate', model='icarus'):
+        ...
+    t.count('output_bytes', data.nbytes)
+    t.dump('trace.json', format='chrome')
+
+"""
+
+import os
+import json
+import time
+import threading
+import contextlib
+
+class tracer:
+    def __init__(self,**kwargs):
+        """ Tracer parameters and attributes
+            Parameters
+            ----------
+                enabled : bool
+                    If False, spans and counters are not recorded. Default True
+
+            Attributes
+            ----------
+            spans : list
+                Completed spans as dicts with keys name, start, duration, depth and args.
+                Times are in seconds from the creation of the tracer.
+
+            counters : dict
+                Accumulated counter values by name.
+
+            hooks : list
+                Callables called as hook(event, name, args) with event 
+                'begin' or 'end' at the start and end of every span.
+
+        """
+        self.enabled=kwargs.get('enabled',True)
+        self.hooks=[]
+        self.reset()
+
+    def reset(self):
+        ''' Clears the recorded spans and counters.
+
+        '''
+        self.spans=[]
+        self.counters={}
+        self._open=[]
+        self._origin=time.perf_counter_ns()
+
+    def begin(self,name,**args):
+        ''' Opens a span.
+
+        '''
+        if not self.enabled:
+            return
+        for hook in self.hooks:
+            hook('begin',name,args)
+        self._open.append((name,args,time.perf_counter_ns()))
+
+    def end(self,name=None):
+        ''' Closes the innermost open span. If name is given, it must match
+        the name of the span.
+
+        '''
+        if not self.enabled or not self._open:
+            return
+        stop=time.perf_counter_ns()
+        opened,args,start=self._open.pop()
+        if name is not None and name != opened:
+            raise ValueError('Closing span %s while span %s is open' %(name,opened))
+        self.spans.append({ 
+            'name' : opened, 
+            'start' : (start-self._origin)*1e-9, 
+            'duration' : (stop-start)*1e-9, 
+            'depth' : len(self._open),
+            'args' : args 
+            })
+        for hook in self.hooks:
+            hook('end',opened,args)
+
+    def record(self,name,start,stop,**args):
+        ''' Adds a completed span measured elsewhere, nested in the innermost
+        open span. start and stop are in the time.perf_counter_ns scale.
+
+        '''
+        if not self.enabled:
+            return
+        self.spans.append({ 
+            'name' : name, 
+            'start' : (start-self._origin)*1e-9, 
+            'duration' : (stop-start)*1e-9, 
+            'depth' : len(self._open),
+            'args' : args 
+            })
+
+    @contextlib.contextmanager
+    def span(self,name,**args):
+        ''' Context manager for a span.
+
+        '''
+        self.begin(name,**args)
+        try:
+            yield self
+        finally:
+            self.end(name)
+
+    def count(self,name,value=1):
+        ''' Adds value to the named counter.
+
+        '''
+        if self.enabled:
+            self.counters[name]=self.counters.get(name,0)+value
+
+    def summary(self):
+        ''' Total duration of the spans in seconds by name.
+
+        '''
+        totals={}
+        for span in self.spans:
+            totals[span['name']]=totals.get(span['name'],0.0)+span['duration']
+        return totals
+
+    def to_json(self):
+        return { 'spans' : self.spans, 'counters' : self.counters, 'summary' : self.summary() }
+
+    def to_chrome_trace(self):
+        ''' Records in the Chrome trace event format.
+
+        '''
+        pid=os.getpid()
+        tid=threading.get_ident()
+        events=[ { 'name' : s['name'], 'ph' : 'X', 'ts' : s['start']*1e6, 'dur' : s['duration']*1e6,
+            'pid' : pid, 'tid' : tid, 'args' : s['args'] } for s in self.spans ]
+        end=max([ s['start']+s['duration'] for s in self.spans ],default=0.0)
+        events+=[ { 'name' : name, 'ph' : 'C', 'ts' : end*1e6, 'pid' : pid, 'tid' : tid, 
+            'args' : { name : value } } for name, value in self.counters.items() ]
+        return { 'traceEvents' : events, 'displayTimeUnit' : 'ms' }
+
+    def dump(self,file,format='json'):
+        ''' Writes the records to a file.
+
+        Parameters
+        ----------
+        file : str
+            Name of the file
+        format : str
+            'json' or 'chrome'. Default 'json'
+
+        '''
+        with open(file,'w') as f:
+            if format == 'chrome':
+                json.dump(self.to_chrome_trace(),f,default=str)
+            else:
+                json.dump(self.to_json(),f,indent=2,default=str)
@@ -0,0 +1,273 @@
+"""
+===============
+Waveform stream
+===============
+
+Chunked readers and incremental extractors for analog waveforms.
+
+Waveforms are processed as chunks of rows (time, value). Read from a
+file, the memory needed is defined by the chunk size instead of the
+length of the simulation. For arrays already in memory, the chunks bound
+the temporaries of the extraction. The extractors follow the semantics
+of spice_iofile:
+
+    * edge_engine: times of threshold crossings, as with iotype='time', and
+      values sampled at trigger crossings, as with iotype='sample', of several
+      signals sharing a time grid in a single pass, with optional hysteresis
+    * decimator: every n'th row of a dense waveform, as with iotype='event'
+    * integrator: trapezoidal integral, mean and peak of a waveform
+
+State is carried over the chunk boundaries, so the results are identical
+to processing the whole waveform at once.
+
+"""
+
+import itertools
+
+import numpy as np
+
+def read_chunks(source,chunksize=2**16):
+    ''' Yields the rows of a waveform in chunks.
+
+    Parameters
+    ----------
+    source : str or ndarray
+        Path of a text file with whitespace separated columns, or an array.
+    chunksize : int
+        Number of rows per chunk.
+
+    Yields
+    ------
+    ndarray
+        Chunk of shape (rows, columns).
+
+    '''
+    if isinstance(source,np.ndarray):
+        for start in range(0,len(source),chunksize):
+            yield source[start:start+chunksize]
+    else:
+        with open(source) as f:
+            while True:
+                lines=list(itertools.islice(f,chunksize))
+                if not lines:
+                    break
+                chunk=np.loadtxt(lines,comments=('#','*'),ndmin=2)
+                if chunk.size:
+                    yield chunk
+
+class decimator:
+    ''' Keeps every n'th row of a waveform.
+
+    Parameters
+    ----------
+    factor : int
+        Decimation factor. Default 1
+
+    '''
+    def __init__(self,factor=1):
+        self.factor=max(1,int(factor))
+        self._offset=0
+        self._rows=[]
+
+    def feed(self,chunk):
+        self._rows.append(np.array(chunk[self._offset::self.factor]))
+        self._offset=(self._offset-len(chunk))%self.factor
+
+    def result(self):
+        if not self._rows:
+            return np.empty((0,2))
+        return np.concatenate(self._rows)
+
+class integrator:
+    ''' Incremental trapezoidal integration of a waveform on a non-uniform 
+    time grid. The number of rows and whether the time is non-decreasing
+    and the rows finite are tracked, see valid().
+
+    '''
+    def __init__(self):
+        self._last=None
+        self._integral=0.0
+        self._peak=0.0
+        self._start=None
+        self.rows=0
+        self.monotonic=True
+        self.finite=True
+
+    def feed(self,chunk):
+        ''' Processes a chunk of (time, value) rows.
+
+        '''
+        if len(chunk) == 0:
+            return
+        t=chunk[:,0]
+        v=chunk[:,1]
+        self.rows+=len(chunk)
+        self.finite=self.finite and bool(np.isfinite(chunk[:,:2]).all())
+        self.monotonic=(self.monotonic and bool((np.diff(t) >= 0).all())
+                and (self._last is None or t[0] >= self._last[0]))
+        if self._last is None:
+            self._start=t[0]
+        else:
+            # Segment between the chunks
+            self._integral+=(t[0]-self._last[0])*(v[0]+self._last[1])/2
+        self._integral+=np.dot(np.diff(t),(v[1:]+v[:-1])/2)
+        self._peak=max(self._peak,np.abs(v).max())
+        self._last=(t[-1],v[-1])
+
+    def valid(self):
+        ''' True if at least two finite rows with non-decreasing time were fed.
+
+        '''
+        return self.rows >= 2 and self.monotonic and self.finite
+
+    def result(self):
+        ''' Integral, mean, peak absolute value and duration of the waveform as a dict.
+
+        '''
+        duration=self._last[0]-self._start if self._last is not None else 0.0
+        return { 
+                'integral' : self._integral, 
+                'mean' : self._integral/duration if duration > 0 else 0.0,
+                'peak' : self._peak,
+                'duration' : duration 
+                }
+
+class edge_engine:
+    ''' Incremental extraction of threshold crossings and triggered samples
+    of several signals in a single vectorized pass.
+
+    The signals must share the time grid, as the nodes of a transient 
+    simulation do. Every distinct (signal, threshold, hysteresis) is 
+    thresholded once, however many outputs use it, the crossings of a 
+    trigger are searched once for all the outputs it samples, and every 
+    signal is interpolated once per trigger.
+
+    With hysteresis h, a signal is high from reaching vth+h/2 until it 
+    falls to vth-h/2. Rising crossings are interpolated at vth+h/2 and 
+    falling at vth-h/2. Crossings are linearly interpolated in time.
+
+    Example::
+
+        engine=edge_engine()
+        engine.crossing('Z_RISE','Z',vth=0.5,edgetype='rising')
+        engine.sample('Z','Z','CLK',vth=0.5,edgetype='rising',ioformat='dec')
+        for z, clk in zip(read_chunks(zfile),read_chunks(clkfile)):
+            engine.feed({ 'Z' : z, 'CLK' : clk })
+        results=engine.result()
+
+    '''
+    def __init__(self):
+        self._signals=[]
+        self._levels=[] # (signal, vth, hysteresis)
+        self._outputs=[] # (name, kind, level, edgetype, signal, ioformat)
+        self._last=None
+        self._results={}
+
+    def _signal(self,name):
+        if name not in self._signals:
+            self._signals.append(name)
+        return self._signals.index(name)
+
+    def _level(self,signal,vth,hysteresis):
+        level=(self._signal(signal),float(vth),float(hysteresis))
+        if level not in self._levels:
+            self._levels.append(level)
+        return self._levels.index(level)
+
+    def crossing(self,name,signal,vth,edgetype='rising',hysteresis=0):
+        ''' Adds output name of the crossing times of signal, as with iotype='time'.
+
+        '''
+        self._outputs.append((name,'time',self._level(signal,vth,hysteresis),edgetype,None,None))
+
+    def sample(self,name,signal,trigger,vth,edgetype='rising',ioformat='dec',hysteresis=0):
+        ''' Adds output name of signal sampled at the crossings of trigger, 
+        as with iotype='sample'. vth is the threshold of the trigger, and of the
+        decision if ioformat is 'dec'.
+
+        '''
+        self._outputs.append((name,'sample',self._level(trigger,vth,hysteresis),edgetype,
+            (self._signal(signal),float(vth)),ioformat))
+
+    def feed(self,chunks):
+        ''' Processes chunks of (time, value) rows of the signals.
+
+        Parameters
+        ----------
+        chunks : dict
+            Chunk of every added signal by name, of equal lengths.
+
+        '''
+        rows=[ chunks[name] for name in self._signals ]
+        if len(set([ len(chunk) for chunk in rows ])) > 1:
+            raise ValueError('Chunks of the signals must have equal lengths')
+        if not rows or len(rows[0]) == 0:
+            return
+        t=rows[0][:,0]
+        v=[ chunk[:,1] for chunk in rows ]
+        if self._last is None:
+            # The first sample has no predecessor, it is compared with itself
+            self._last=(t[0],[ signal[0] for signal in v ],[ None ]*len(self._levels))
+        tlast,vlast,slast=self._last
+        states=[]
+        for level, (signal, vth, hysteresis) in enumerate(self._levels):
+            hi=vth+hysteresis/2
+            lo=vth-hysteresis/2
+            state=v[signal] >= hi
+            if hysteresis > 0:
+                # States within the hysteresis hold the previous state
+                decided=state | (v[signal] <= lo)
+                held=np.where(decided,np.arange(len(state)),-1)
+                np.maximum.accumulate(held,out=held)
+                state=np.where(held >= 0,state[np.maximum(held,0)],
+                        v[signal][0] >= vth if slast[level] is None else slast[level])
+            # Previous state is the first one of the chunk 
+            states.append((state,state[0] if slast[level] is None else slast[level],hi,lo))
+        self._last=(t[-1],[ signal[-1] for signal in v ],[ state[-1] for state, *_ in states ])
+        edges={}
+        for name, kind, level, edgetype, signal, ioformat in self._outputs:
+            key=(level,edgetype)
+            if key not in edges:
+                state,previous,hi,lo=states[level]
+                before=np.concatenate(([previous],state[:-1]))
+                if edgetype == 'rising':
+                    idx=np.flatnonzero(state > before)
+                    at=hi
+                elif edgetype == 'falling':
+                    idx=np.flatnonzero(state < before)
+                    at=lo
+                else:
+                    idx=np.flatnonzero(state != before)
+                    at=np.where(state[idx],hi,lo)
+                # Index of the preceding sample, -1 refers to the last sample of the previous chunk
+                pre=idx-1
+                first=pre < 0
+                trigger=v[self._levels[level][0]]
+                v0=np.where(first,vlast[self._levels[level][0]],trigger[pre])
+                dv=trigger[idx]-v0
+                frac=np.divide(at-v0,dv,out=np.zeros(len(idx)),where=dv != 0)
+                edges[key]=[idx,pre,first,frac,{}]
+            idx,pre,first,frac,sampled=edges[key]
+            if kind == 'time':
+                t0=np.where(first,tlast,t[pre])
+                values=t0+frac*(t[idx]-t0)
+            else:
+                # Every signal is interpolated once for all outputs it is sampled to
+                if signal[0] not in sampled:
+                    v0=np.where(first,vlast[signal[0]],v[signal[0]][pre])
+                    sampled[signal[0]]=v0+frac*(v[signal[0]][idx]-v0)
+                values=sampled[signal[0]]
+                if ioformat == 'dec':
+                    values=(values >= signal[1]).astype(int)
+            self._results.setdefault(name,[]).append(values)
+
+    def result(self):
+        ''' Outputs of shape (n,1) by name.
+
+        '''
+        results={}
+        for name, kind, level, edgetype, signal, ioformat in self._outputs:
+            chunks=self._results.get(name,[])
+            dtype=int if kind == 'sample' and ioformat == 'dec' else float
+            results[name]=(np.concatenate(chunks) if chunks else np.empty(0,dtype=dtype)).reshape(-1,1)
+        return results
@@ -0,0 +1,192 @@
+"""
+==============
+Workspace pool
+==============
+
+Pool of simulation directories reused from run to run.
+
+A simulation run normally creates a new directory, writes the testbench
+and the IO files in it and deletes it afterwards. On network file
+systems this metadata traffic dominates under parallel load. With the
+pool, every process gets a slot, a fixed run name whose directory is
+kept and overwritten by the subsequent runs of the process. Slots of
+exited processes are handed to new processes, so the number of
+directories is bounded by the number of concurrent processes.
+
+If a tmpfs is available, the directories of the slots are created on
+it, and linked to the simulation path of the entity. The files of the
+runs then never reach the network file system. A process releases its
+slot and removes its tmpfs directories at exit, and the tmpfs
+directories of other idle slots are removed when a slot is acquired.
+Links left to removed directories are repaired by attach(). Idle slots
+and their links in the simulation path are removed in a batch by
+cleanup().
+
+"""
+
+import os
+import sys
+import json
+import atexit
+import fcntl
+import shutil
+import socket
+import tempfile
+import contextlib
+if not (os.path.abspath('../../thesdk') in sys.path):
+    sys.path.append(os.path.abspath('../../thesdk'))
+
+from thesdk import *
+
+from inverter.core_scheduler import core_scheduler
+
+class workspace_pool(thesdk):
+    def _classfile(self):
+        return os.path.dirname(os.path.realpath(__file__)) + "/"+__name__
+
+    def __init__(self,*arg,**kwargs):
+        """ Workspace pool parameters and attributes
+            Parameters
+            ----------
+                *arg :
+                If any arguments are defined, the first one should be the parent instance
+
+                path : str
+                    Directory of the slot registry and of the slots on tmpfs. Default:
+                    inverter_workspace_<uid> on tmpfs if available, otherwise in
+                    the temporary directory
+
+                tmpfs : str
+                    Mount point of a tmpfs for the slots, or None to keep the slots in the
+                    simulation path of the entity. Default '/dev/shm' if it exists
+
+        """
+        if len(arg)>=1:
+            self.parent=arg[0]
+        default_tmpfs='/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm',os.W_OK) else None
+        self.tmpfs=kwargs.get('tmpfs',default_tmpfs)
+        self.path=kwargs.get('path',os.path.join(self.tmpfs or tempfile.gettempdir(),
+            'inverter_workspace_%d' %(os.getuid())))
+        self._slot=None
+
+    @contextlib.contextmanager
+    def _locked(self):
+        os.makedirs(self.path,exist_ok=True)
+        registry_file=os.path.join(self.path,'slots.json')
+        with open(registry_file+'.lock','a') as lock:
+            fcntl.flock(lock,fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(registry_file) as f:
+                        registry=json.load(f)
+                except (OSError, ValueError):
+                    registry={}
+                yield registry
+                with open(registry_file+'.tmp','w') as f:
+                    json.dump(registry,f)
+                os.replace(registry_file+'.tmp',registry_file)
+            finally:
+                fcntl.flock(lock,fcntl.LOCK_UN)
+
+    def acquire(self):
+        ''' Returns the slot of this process. A process keeps its slot until it exits.
+
+        Returns
+        -------
+        str
+            Run name of the slot
+
+        '''
+        pid=os.getpid()
+        if self._slot is not None and self._slot[0] == pid:
+            return self._slot[1]
+        with self._locked() as registry:
+            slots=[ slot for slot, owner in registry.items() if owner == pid ]
+            if not slots:
+                # Lowest slot whose process has exited
+                free=[ slot for slot, owner in registry.items() if not core_scheduler._alive(owner) ]
+                slots=sorted(free,key=lambda slot: int(slot.rsplit('_',1)[1]))
+                if not slots:
+                    index=max([ int(slot.rsplit('_',1)[1]) for slot in registry ]+[-1])+1
+                    slots=['workspace_%s_%d' %(socket.gethostname().split('.')[0],index)]
+                registry[slots[0]]=pid
+                # Slots of other exited processes are reclaimed
+                for slot in slots[1:]:
+                    del registry[slot]
+                self._remove(slots[1:],[ self.path ])
+        if self._slot is None:
+            atexit.register(self.release)
+        self._slot=(pid,slots[0])
+        return slots[0]
+
+    def release(self):
+        ''' Releases the slot of this process and removes its tmpfs directories.
+        Registered to run at the exit of the process by acquire.
+
+        '''
+        if self._slot is None or self._slot[0] != os.getpid():
+            return
+        slot=self._slot[1]
+        self._slot=None
+        with self._locked() as registry:
+            if registry.get(slot) == os.getpid():
+                del registry[slot]
+                self._remove([ slot ],[ self.path ])
+
+    @staticmethod
+    def _remove(slots,roots):
+        for root in roots:
+            if not os.path.isdir(root):
+                continue
+            for model in os.listdir(root):
+                for slot in slots:
+                    path=os.path.join(root,model,slot)
+                    if os.path.islink(path):
+                        os.unlink(path)
+                    elif os.path.isdir(path):
+                        shutil.rmtree(path,ignore_errors=True)
+
+    def attach(self,simpath):
+        ''' Links simpath to the tmpfs directory of its slot. Does nothing if no tmpfs
+        is available or simpath is a directory with files of earlier runs. A removed 
+        tmpfs directory of a link is recreated, an empty directory at simpath is
+        replaced with the link.
+
+        '''
+        if self.tmpfs is None:
+            return
+        target=os.path.join(self.path,os.path.basename(os.path.dirname(simpath)),os.path.basename(simpath))
+        os.makedirs(target,exist_ok=True)
+        if os.path.islink(simpath):
+            if os.path.exists(simpath):
+                return
+            # Dangling link to a directory of another pool
+            os.unlink(simpath)
+        elif os.path.isdir(simpath):
+            try:
+                os.rmdir(simpath)
+            except OSError:
+                return
+        os.makedirs(os.path.dirname(simpath),exist_ok=True)
+        try:
+            os.symlink(target,simpath)
+        except FileExistsError:
+            pass # Linked by another process
+
+    def cleanup(self,simulations=None):
+        ''' Removes the directories of the slots of exited processes in a batch.
+
+        Parameters
+        ----------
+        simulations : str
+            Simulation directory of the entity, whose links and directories of the
+            slots are removed as well. Default None
+
+        '''
+        with self._locked() as registry:
+            idle=[ slot for slot, owner in registry.items() if not core_scheduler._alive(owner) ]
+            for slot in idle:
+                del registry[slot]
+            self._remove(idle,[ self.path ]+([ simulations ] if simulations else []))
+        self.print_log(type='I', msg='Removed %d idle workspace slots' %(len(idle)))
+        return len(idle)
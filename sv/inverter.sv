@@ -1,7 +1,8 @@
-module inverter( input reset,
-                 input A, 
-                 output Z );
+module inverter #( parameter g_lanes = 1 )
+               ( input reset,
+                 input [g_lanes-1:0] A, 
+                 output [g_lanes-1:0] Z );
 //reset does nothing
-assign Z= !A;
+assign Z= ~A;
 
 endmodule